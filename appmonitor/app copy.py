@@ -7,7 +7,6 @@ from flask_login import (
     logout_user, current_user
 )
 from werkzeug.security import check_password_hash
-import requests
 import os
 
 from datetime import datetime
@@ -18,6 +17,7 @@ from models import (
     Application, Interface, InterfaceEndpoint,
     AuditLog
 )
+from probe import check_url, fetch_number
 
 # =====================================================
 # APP INIT
@@ -59,29 +59,6 @@ def audit(action, entity, old=None, new=None, notes=None):
     db.session.commit()
 
 
-def check_url(url):
-    """Generic URL health check"""
-    try:
-        r = requests.get(
-            url,
-            timeout=5,
-            verify=False,
-            headers={"User-Agent": "Monitoring-Portal"}
-        )
-        return r.status_code < 400
-    except Exception:
-        return False
-
-
-def fetch_number(url):
-    """Fetch numeric metric from API"""
-    try:
-        r = requests.get(url, timeout=5, verify=False)
-        return int(r.text.strip())
-    except Exception:
-        return 0
-
-
 # =====================================================
 # APPLICATION SELECTION
 # =====================================================
@@ -1,28 +1,59 @@
 from flask import (
     Flask, render_template, redirect,
-    request, jsonify, session, url_for
+    request, jsonify, session, url_for, Response, g, abort
 )
 from flask_login import (
     LoginManager, login_user,
     login_required, logout_user, current_user
 )
 from werkzeug.security import check_password_hash
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload
 from datetime import datetime
-import requests
+import json
+import os
+import queue
+import signal
+import sys
+import time
 
 from models import (
     db, User,
     Application, Interface, InterfaceEndpoint,
-    AuditLog
+    AuditLog, enable_sqlite_pragmas, upgrade_schema
 )
+import latency
+import metrics
+import rollups
+import scheduler
+import series
+import topology
+from probe import normalize_url
+from writer import WRITER
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "shell-secure-key"
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///monitor.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Dashboard APIs serve scheduler results; ?refresh=1 re-probes
+# entries older than this many seconds
+app.config["MONITOR_CACHE_TTL"] = 60
+
+# Seconds between SSE keep-alive comments on an idle stream
+app.config["STREAM_KEEPALIVE"] = 15
+
 db.init_app(app)
 
+with app.app_context():
+    enable_sqlite_pragmas(db.engine)
+    upgrade_schema()
+    topology.refresh()
+
+# Audit rows are written in batches off the request thread;
+# whatever is queued is flushed at interpreter exit
+WRITER.start(app)
+
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
@@ -32,40 +63,141 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
+REQUEST_DURATION = metrics.Histogram(
+    "http_request_duration_seconds",
+    "Time to build a response in the web UI / APIs"
+)
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def ensure_scheduler():
+    """
+    Whatever serves the app (app.run, flask run, a WSGI server), the
+    process answering requests runs the monitors; the debug
+    reloader's watcher process never gets here.
+    """
+    scheduler.start_scheduler(app)
+
+
+@app.after_request
+def record_request_duration(response):
+    REQUEST_DURATION.observe(time.perf_counter() - g.request_started)
+    return response
+
+
 # =====================================================
 # HELPERS
 # =====================================================
 
+AUDIT_INSERT = insert(AuditLog.__table__)
+
+
 def audit(action, entity, old=None, new=None):
+    """
+    Queues an audit row on the batch writer. Falls back to writing
+    it on the request thread if the writer is stopped or its queue
+    is full; batches that keep failing are retried row by row
+    (write_audit_rows).
+    """
     if not current_user.is_authenticated:
         return
 
-    log = AuditLog(
-        user=current_user.username,
-        action=action,
-        entity=entity,
-        old_value=str(old) if old else "",
-        new_value=str(new) if new else "",
-        timestamp=datetime.utcnow()
-    )
-    db.session.add(log)
+    row = {
+        "user": current_user.username,
+        "action": action,
+        "entity": entity,
+        "old_value": str(old) if old else "",
+        "new_value": str(new) if new else "",
+        "notes": None,
+        "timestamp": datetime.utcnow()
+    }
+
+    # timeout=0: never hold a request on a full queue
+    if WRITER.running and WRITER.put(AUDIT_INSERT, row, timeout=0):
+        return
+
+    db.session.add(AuditLog(**row))
     db.session.commit()
 
 
-def check_url(url):
-    try:
-        r = requests.get(url, timeout=5, verify=False)
-        return r.status_code < 400
-    except Exception:
-        return False
+def write_audit_rows(rows):
+    """
+    Writer fallback for an audit batch that failed: one insert and
+    commit per row; a row that still fails is printed to the log
+    """
+    for row in rows:
+        try:
+            db.session.execute(AUDIT_INSERT, row)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[Audit] Lost entry {row}: {e}")
+
+    db.session.remove()
 
 
-def fetch_number(url):
+WRITER.on_drop(AUDIT_INSERT, write_audit_rows)
+
+
+def form_int(name):
+    """Optional integer form field ("" -> None); 400 if not an integer"""
+    value = request.form.get(name, "").strip()
+    if not value:
+        return None
     try:
-        r = requests.get(url, timeout=5, verify=False)
-        return int(r.text.strip())
-    except Exception:
-        return 0
+        return int(value)
+    except ValueError:
+        abort(400, f"{name} must be a whole number of seconds")
+
+
+def poll_bounds():
+    """
+    (min_poll_interval, max_poll_interval) from the form; each is
+    optional, at least scheduler.MIN_POLL_INTERVAL, and max >= min
+    """
+    bounds = form_int("min_poll_interval"), form_int("max_poll_interval")
+    floor = scheduler.MIN_POLL_INTERVAL
+
+    if any(b is not None and b < floor for b in bounds):
+        abort(400, f"Poll intervals must be at least {floor} seconds")
+    if None not in bounds and bounds[1] < bounds[0]:
+        abort(400, "Max poll interval must not be below the min poll interval")
+
+    return bounds
+
+
+def commit_topology(kind, entity):
+    """
+    Commits an admin change together with its config change feed
+    entry, then brings the topology snapshot up to date
+    """
+    db.session.flush()   # ids of new rows
+    topology.record_change(kind, entity)
+    db.session.commit()
+    topology.sync()
+
+
+def with_age(entry):
+    """Copy of a MONITOR_CACHE entry plus its age in seconds"""
+    data = dict(entry)
+    data["age"] = round(time.time() - entry["last_checked"], 1)
+    return data
+
+
+def needs_refresh(entry):
+    if entry is None:
+        return True
+
+    if request.args.get("refresh") not in ("1", "true"):
+        return False
+
+    age = time.time() - entry["last_checked"]
+    return age > app.config["MONITOR_CACHE_TTL"]
 
 
 # =====================================================
@@ -74,7 +206,7 @@ def fetch_number(url):
 
 @app.route("/", methods=["GET", "POST"])
 def select_application():
-    apps = Application.query.filter_by(is_active=True).all()
+    apps = topology.current().active_apps()
 
     if request.method == "POST":
         session["selected_app_id"] = int(request.form["application_id"])
@@ -99,14 +231,15 @@ def home():
     if not app_id:
         return redirect("/")
 
-    app_obj = Application.query.get_or_404(app_id)
+    topo = topology.current()
+    if app_id not in topo.apps:
+        abort(404)
 
-    interfaces = Interface.query.filter_by(
-        source_app_id=app_id,
-        is_active=True
-    ).all()
-
-    return render_template("home.html", app=app_obj, interfaces=interfaces)
+    return render_template(
+        "home.html",
+        app=topo.apps[app_id],
+        interfaces=topo.active_interfaces(app_id)
+    )
 
 
 # =====================================================
@@ -115,32 +248,222 @@ def home():
 
 @app.route("/api/app-health/<int:app_id>")
 def api_app_health(app_id):
-    app_obj = Application.query.get_or_404(app_id)
+    entry = scheduler.MONITOR_CACHE["applications"].get(app_id)
 
-    return jsonify({
-        "healthy": check_url(app_obj.app_health_url),
-        "active_users": fetch_number(app_obj.active_users_url)
-    })
+    if needs_refresh(entry):
+        app_obj = topology.current().apps.get(app_id)
+        if app_obj is None:
+            abort(404)
+        entry = scheduler.refresh_application(app_obj)
+
+    if entry is None:
+        return jsonify({"error": "probe timed out"}), 504
+
+    return jsonify(with_age(entry))
 
 
 @app.route("/api/interface-health/<int:interface_id>")
 def api_interface_health(interface_id):
-    endpoints = InterfaceEndpoint.query.filter_by(
-        interface_id=interface_id,
-        is_active=True
-    ).all()
+    entry = scheduler.MONITOR_CACHE["interfaces"].get(interface_id)
 
-    result = {"inbound": None, "outbound": None}
+    if needs_refresh(entry):
+        interface = topology.current().interfaces.get(interface_id)
+        if interface is None:
+            abort(404)
+        entry = scheduler.refresh_interfaces([interface])[interface_id]
 
-    for ep in endpoints:
-        data = {
-            "reachable": check_url(ep.connectivity_url),
-            "total": fetch_number(ep.transaction_count_url),
-            "failed": fetch_number(ep.error_count_url)
-        }
-        result[ep.direction.lower()] = data
+    return jsonify(with_age(entry))
 
-    return jsonify(result)
+
+@app.route("/api/app/<int:app_id>/snapshot")
+def api_app_snapshot(app_id):
+    """
+    Application health plus every active interface in one response,
+    so the dashboard needs a single round trip per refresh.
+    """
+    app_obj = topology.current().apps.get(app_id)
+    if app_obj is None:
+        abort(404)
+
+    app_entry = scheduler.MONITOR_CACHE["applications"].get(app_id)
+    if needs_refresh(app_entry):
+        app_entry = scheduler.refresh_application(app_obj)
+
+    interfaces = [i for i in app_obj.interfaces if i.is_active]
+    entries = {
+        i.id: scheduler.MONITOR_CACHE["interfaces"].get(i.id)
+        for i in interfaces
+    }
+
+    stale = [i for i in interfaces if needs_refresh(entries[i.id])]
+    if stale:
+        entries.update(scheduler.refresh_interfaces(stale))
+
+    return jsonify({
+        "app": with_age(app_entry) if app_entry else None,
+        "interfaces": [
+            dict(with_age(entries[i.id]), id=i.id)
+            for i in interfaces
+            if entries[i.id]
+        ]
+    })
+
+
+@app.route("/api/latency/<kind>/<int:entity_id>")
+def api_latency(kind, entity_id):
+    """
+    Response times of an application health URL or an endpoint
+    connectivity URL: p50 / p95 / p99 plus the recent raw samples.
+    """
+    topo = topology.current()
+    if kind == "app":
+        node = topo.apps.get(entity_id)
+        url = node and node.app_health_url
+    elif kind == "endpoint":
+        node = topo.endpoints.get(entity_id)
+        url = node and node.connectivity_url
+    else:
+        return jsonify({"error": "kind must be app or endpoint"}), 404
+
+    if url is None:
+        abort(404)
+
+    key = normalize_url(url)
+    return jsonify({
+        "url": url,
+        "summary": latency.summary(key),
+        "recent": latency.recent(key)
+    })
+
+
+@app.route("/api/sla/<kind>/<int:entity_id>")
+def api_sla(kind, entity_id):
+    """
+    Availability / volume over ?from=&to= (epoch seconds, default
+    the last 30 days), read from the hourly rollups.
+    """
+    if kind not in rollups.UP_FIELD:
+        return jsonify({"error": "kind must be app or endpoint"}), 404
+
+    until = request.args.get("to", time.time(), type=float)
+    since = request.args.get("from", until - 30 * rollups.DAY, type=float)
+
+    return jsonify(dict(
+        rollups.sla(kind, entity_id, since, until),
+        since=since,
+        until=until
+    ))
+
+
+@app.route("/api/history/<kind>")
+@app.route("/api/history/<kind>/<int:entity_id>")
+def api_history(kind, entity_id=None):
+    """
+    ?from=&to= (epoch seconds, default the last 24 h), ?points=N and
+    ?field= (see series.FIELDS). At most N points, LTTB downsampled.
+    Without an id in the path, ?ids=1,2,3 returns one series per id
+    from a single call (dashboard sparklines).
+    """
+    if kind not in series.FIELDS:
+        return jsonify({"error": "kind must be app or endpoint"}), 404
+
+    field = request.args.get("field", series.FIELDS[kind][0])
+    if field not in series.FIELDS[kind]:
+        return jsonify({"error": f"field must be one of {series.FIELDS[kind]}"}), 400
+
+    until = request.args.get("to", time.time(), type=float)
+    since = request.args.get("from", until - rollups.DAY, type=float)
+    points = request.args.get("points", series.DEFAULT_POINTS, type=int)
+    points = max(3, min(points, series.MAX_POINTS))
+
+    if entity_id is not None:
+        source, data = series.series(kind, entity_id, field, since, until, points)
+
+        return jsonify({
+            "kind": kind,
+            "id": entity_id,
+            "field": field,
+            "source": source,
+            "since": since,
+            "until": until,
+            "points": data
+        })
+
+    try:
+        ids = [int(i) for i in request.args.get("ids", "").split(",") if i]
+    except ValueError:
+        return jsonify({"error": "ids must be comma separated integers"}), 400
+
+    source, data = series.series_many(kind, ids, field, since, until, points)
+
+    return jsonify({
+        "kind": kind,
+        "field": field,
+        "source": source,
+        "since": since,
+        "until": until,
+        "series": {str(i): data[i] for i in data}
+    })
+
+
+@app.route("/api/stream/app/<int:app_id>")
+def api_stream_app(app_id):
+    """
+    Server-Sent Events: pushes app / interface states of one
+    application as soon as the scheduler sees them change.
+    """
+    topo = topology.current()
+    if app_id not in topo.apps:
+        abort(404)
+
+    interface_ids = {i.id for i in topo.active_interfaces(app_id)}
+    keepalive = app.config["STREAM_KEEPALIVE"]
+
+    def events():
+        q = scheduler.subscribe()
+        try:
+            # Flushes the headers so the browser's onopen fires right away
+            yield "retry: 5000\n\n"
+
+            while True:
+                try:
+                    kind, entity_id, entry = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if kind == "app" and entity_id != app_id:
+                    continue
+                if kind == "interface" and entity_id not in interface_ids:
+                    continue
+
+                data = dict(with_age(entry), id=entity_id)
+                yield f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            scheduler.unsubscribe(q)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# =====================================================
+# INTERNAL
+# =====================================================
+
+@app.route("/internal/scheduler-stats")
+def internal_scheduler_stats():
+    """Scheduler lag / overrun / queue counters for sizing workers"""
+    return jsonify(metrics.snapshot_all())
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Pre-rendered by the scheduler; rendered here only before its first pass"""
+    body = metrics.EXPOSITION or scheduler.render_metrics()
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 
 # =====================================================
@@ -177,7 +500,7 @@ def logout():
 @app.route("/admin")
 @login_required
 def admin():
-    apps = Application.query.all()
+    apps = list(topology.current().apps.values())
     return render_template("admin.html", applications=apps)
 
 
@@ -192,7 +515,7 @@ def add_application():
         is_active=True
     )
     db.session.add(app_obj)
-    db.session.commit()
+    commit_topology("app", app_obj)
 
     audit("CREATE", "Application", None, app_obj.name)
     return redirect("/admin")
@@ -201,19 +524,23 @@ def add_application():
 @app.route("/admin/application/<int:app_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_application(app_id):
-    app_obj = Application.query.get_or_404(app_id)
-
     if request.method == "POST":
+        app_obj = Application.query.get_or_404(app_id)
         app_obj.name = request.form["name"]
         app_obj.environment = request.form["environment"]
         app_obj.app_health_url = request.form["health_url"]
         app_obj.active_users_url = request.form["users_url"]
-        db.session.commit()
+        app_obj.min_poll_interval, app_obj.max_poll_interval = poll_bounds()
+        commit_topology("app", app_obj)
 
         audit("UPDATE", "Application", app_id, app_obj.name)
         return redirect("/admin")
 
-    return render_template("application_form.html", application=app_obj)
+    application = topology.current().apps.get(app_id)
+    if application is None:
+        abort(404)
+
+    return render_template("application_form.html", application=application)
 
 
 @app.route("/admin/application/<int:app_id>/activate")
@@ -221,7 +548,7 @@ def edit_application(app_id):
 def activate_application(app_id):
     app_obj = Application.query.get_or_404(app_id)
     app_obj.is_active = True
-    db.session.commit()
+    commit_topology("app", app_obj)
     return redirect("/admin")
 
 
@@ -230,7 +557,7 @@ def activate_application(app_id):
 def deactivate_application(app_id):
     app_obj = Application.query.get_or_404(app_id)
     app_obj.is_active = False
-    db.session.commit()
+    commit_topology("app", app_obj)
     return redirect("/admin")
 
 
@@ -241,7 +568,9 @@ def deactivate_application(app_id):
 @app.route("/admin/application/<int:app_id>/interfaces", methods=["GET", "POST"])
 @login_required
 def manage_interfaces(app_id):
-    application = Application.query.get_or_404(app_id)
+    application = topology.current().apps.get(app_id)
+    if application is None:
+        abort(404)
 
     if request.method == "POST":
         interface = Interface(
@@ -251,16 +580,14 @@ def manage_interfaces(app_id):
             is_active=True
         )
         db.session.add(interface)
-        db.session.commit()
+        commit_topology("interface", interface)
 
         return redirect(url_for("manage_interfaces", app_id=app_id))
 
-    interfaces = Interface.query.filter_by(source_app_id=app_id).all()
-
     return render_template(
         "interface_form.html",
         application=application,
-        interfaces=interfaces
+        interfaces=application.interfaces
     )
 
 
@@ -271,20 +598,25 @@ def manage_interfaces(app_id):
 @app.route("/admin/interface/<int:interface_id>/endpoints", methods=["GET", "POST"])
 @login_required
 def interface_endpoints(interface_id):
-    interface = Interface.query.get_or_404(interface_id)
-
     if request.method == "POST":
+        interface = (
+            Interface.query
+            .options(joinedload(Interface.endpoints))
+            .filter_by(id=interface_id)
+            .first_or_404()
+        )
+        by_direction = {ep.direction: ep for ep in interface.endpoints}
         direction = request.form["direction"]
+        min_poll, max_poll = poll_bounds()
 
-        endpoint = InterfaceEndpoint.query.filter_by(
-            interface_id=interface_id,
-            direction=direction
-        ).first()
+        endpoint = by_direction.get(direction)
 
         if endpoint:
             endpoint.connectivity_url = request.form["connectivity_url"]
             endpoint.transaction_count_url = request.form["transaction_count_url"]
             endpoint.error_count_url = request.form["error_count_url"]
+            endpoint.min_poll_interval = min_poll
+            endpoint.max_poll_interval = max_poll
         else:
             endpoint = InterfaceEndpoint(
                 interface_id=interface_id,
@@ -292,29 +624,28 @@ def interface_endpoints(interface_id):
                 connectivity_url=request.form["connectivity_url"],
                 transaction_count_url=request.form["transaction_count_url"],
                 error_count_url=request.form["error_count_url"],
+                min_poll_interval=min_poll,
+                max_poll_interval=max_poll,
                 is_active=True
             )
             db.session.add(endpoint)
 
-        db.session.commit()
+        commit_topology("endpoint", endpoint)
 
         return redirect(url_for("interface_endpoints", interface_id=interface_id))
 
-    inbound = InterfaceEndpoint.query.filter_by(
-        interface_id=interface_id,
-        direction="INBOUND"
-    ).first()
-
-    outbound = InterfaceEndpoint.query.filter_by(
-        interface_id=interface_id,
-        direction="OUTBOUND"
-    ).first()
+    topo = topology.current()
+    interface = topo.interfaces.get(interface_id)
+    if interface is None:
+        abort(404)
+    by_direction = {ep.direction: ep for ep in interface.endpoints}
 
     return render_template(
         "interface_endpoints.html",
+        application=topo.application_of(interface),
         interface=interface,
-        inbound=inbound,
-        outbound=outbound
+        inbound=by_direction.get("INBOUND"),
+        outbound=by_direction.get("OUTBOUND")
     )
 
 
@@ -334,4 +665,12 @@ def interface_endpoints(interface_id):
 # =====================================================
 
 if __name__ == "__main__":
+    # Start right away instead of on the first request; with the
+    # debug reloader only the child process serves (and monitors)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        scheduler.start_scheduler(app)
+
+    # SIGTERM -> normal exit, so the atexit flushes still run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     app.run(debug=True)
@@ -0,0 +1,444 @@
+"""
+async_probe.py
+asyncio probe engine for the scheduler
+Keeps thousands of health / counter checks in flight
+on a single event loop thread instead of one thread per probe
+"""
+
+import asyncio
+import base64
+import ssl
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from requests.utils import get_environ_proxies, select_proxy
+from urllib.parse import unquote, urlsplit, urljoin
+
+import latency
+import probe
+from probe import (
+    PROBE_TIMEOUT, POOL_MAXSIZE, IDLE_TIMEOUT, USER_AGENT,
+    RESULTS, MISS, BREAKER, PROBE_DURATION, DEFAULT_PORTS, HostUnavailable,
+    host_key, normalize_url, result_key
+)
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+MAX_IN_FLIGHT = 1000   # open sockets at once (keep below the fd limit)
+MAX_REDIRECTS = 5
+MAX_BODY = 64 * 1024   # counters are tiny, never buffer a whole page
+PROXY_WORKERS = 16     # threads probing hosts behind an HTTP(S) proxy
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# verify=False equivalent
+_SSL_CONTEXT = ssl.create_default_context()
+_SSL_CONTEXT.check_hostname = False
+_SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+
+# =====================================================
+# MINIMAL HTTP/1.1 GET
+# =====================================================
+
+async def _read_headers(reader):
+    headers = {}
+
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _read_body(reader, headers):
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = b""
+        while len(body) < MAX_BODY:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await _read_headers(reader)   # trailers
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+        return body
+
+    if "content-length" in headers:
+        length = min(int(headers["content-length"]), MAX_BODY)
+        return await reader.readexactly(length)
+
+    return await reader.read(MAX_BODY)
+
+
+# =====================================================
+# KEEP-ALIVE POOL
+# Only touched from the engine's event loop thread
+# =====================================================
+
+# (host, port, https) -> [(reader, writer, last_used), ...]
+_IDLE_CONNECTIONS = {}
+
+
+async def _connect(key):
+    """Returns (reader, writer, reused)"""
+    idle = _IDLE_CONNECTIONS.get(key, [])
+    now = time.monotonic()
+
+    while idle:
+        reader, writer, last_used = idle.pop()
+        if (now - last_used < IDLE_TIMEOUT
+                and not writer.is_closing() and not reader.at_eof()):
+            return reader, writer, True
+        writer.close()
+
+    host, port, https = key
+    reader, writer = await asyncio.open_connection(
+        host,
+        port,
+        ssl=_SSL_CONTEXT if https else None
+    )
+    return reader, writer, False
+
+
+def _release(key, reader, writer):
+    idle = _IDLE_CONNECTIONS.setdefault(key, [])
+
+    if len(idle) >= POOL_MAXSIZE:
+        writer.close()
+        return
+
+    idle.append((reader, writer, time.monotonic()))
+
+
+def evict_idle():
+    now = time.monotonic()
+
+    for key, idle in list(_IDLE_CONNECTIONS.items()):
+        keep = []
+        for reader, writer, last_used in idle:
+            if now - last_used < IDLE_TIMEOUT and not writer.is_closing():
+                keep.append((reader, writer, last_used))
+            else:
+                writer.close()
+
+        if keep:
+            _IDLE_CONNECTIONS[key] = keep
+        else:
+            del _IDLE_CONNECTIONS[key]
+
+
+def _host_header(parts):
+    """host[:port] without credentials; default ports left out"""
+    host = parts.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"     # IPv6 literal
+    if parts.port and parts.port != DEFAULT_PORTS.get(parts.scheme):
+        host = f"{host}:{parts.port}"
+    return host
+
+
+def _basic_auth(parts):
+    """Authorization header value for user:pass@ in the URL, or None"""
+    if not parts.username:
+        return None
+    credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+    return "Basic " + base64.b64encode(credentials.encode("latin-1")).decode()
+
+
+async def _request(key, host, path, read_body, progress, auth=None):
+    """
+    One GET over a pooled connection. A reused connection the
+    server already dropped is retried once on a fresh one.
+    Returns (status, headers, body, connect_s, ttfb_s); connect_s
+    is None when a pooled connection was reused.
+    progress["connected"] is set once a connection is in hand.
+    """
+    while True:
+        started = time.perf_counter()
+        reader, writer, reused = await _connect(key)
+        connected = time.perf_counter()
+        progress["connected"] = True
+        keep = False
+
+        try:
+            writer.write((
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {host}\r\n"
+                f"User-Agent: {USER_AGENT}\r\n"
+                "Accept: */*\r\n"
+                + (f"Authorization: {auth}\r\n" if auth else "")
+                + "\r\n"
+            ).encode("latin-1"))
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line and reused:
+                continue
+            first_byte = time.perf_counter()
+
+            status = int(status_line.split()[1])
+            headers = await _read_headers(reader)
+
+            framed = (
+                "content-length" in headers
+                or headers.get("transfer-encoding", "").lower() == "chunked"
+            )
+            small = int(headers.get("content-length", 0)) <= MAX_BODY
+
+            # Health checks skip the body unless draining it keeps the socket
+            if read_body or (framed and small):
+                body = await _read_body(reader, headers)
+            else:
+                body = b""
+
+            keep = (
+                framed and small and len(body) < MAX_BODY
+                and headers.get("connection", "").lower() != "close"
+            )
+            return (
+                status, headers, body,
+                None if reused else connected - started,
+                first_byte - started
+            )
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+
+        finally:
+            if keep:
+                _release(key, reader, writer)
+            else:
+                writer.close()
+
+
+async def http_get(url, read_body=True):
+    """
+    Returns (status_code, body). Follows redirects like requests.get.
+    Body is only read when asked for (health checks need the status only).
+    """
+    auth, auth_host = None, None
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        https = parts.scheme == "https"
+        key = (parts.hostname, parts.port or (443 if https else 80), https)
+
+        # Basic auth from user:pass@, kept across same-host redirects
+        # only (like requests)
+        if parts.username:
+            auth, auth_host = _basic_auth(parts), parts.hostname
+        elif parts.hostname != auth_host:
+            auth = None
+
+        breaker_host = host_key(url)
+        if not BREAKER.allow(breaker_host):
+            raise HostUnavailable(breaker_host)
+
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        started = time.perf_counter()
+        progress = {"connected": False}
+        try:
+            status, headers, body, connect_s, ttfb_s = await _request(
+                key, _host_header(parts), path, read_body, progress, auth
+            )
+        except asyncio.CancelledError:
+            # Timed out: while connecting the host counts as down,
+            # with a connection in hand it is up but slow
+            if progress["connected"]:
+                BREAKER.record_success(breaker_host)
+            else:
+                BREAKER.record_failure(breaker_host)
+            raise
+        except (OSError, asyncio.IncompleteReadError):
+            # Refused / unroutable / reset
+            BREAKER.record_failure(breaker_host)
+            raise
+        except Exception:
+            # Connected but broken answer: the host itself is up
+            BREAKER.record_success(breaker_host)
+            raise
+        finally:
+            PROBE_DURATION.observe(time.perf_counter() - started)
+
+        # Every completed request settles the circuit, pooled or not
+        BREAKER.record_success(breaker_host)
+
+        latency.record(
+            normalize_url(url),
+            time.perf_counter() - started,
+            ttfb_s=ttfb_s,
+            connect_s=connect_s
+        )
+
+        if status in REDIRECT_CODES and "location" in headers:
+            url = urljoin(url, headers["location"])
+            continue
+
+        return status, body
+
+    raise ValueError(f"Too many redirects: {url}")
+
+
+# =====================================================
+# PROXIES
+# This client only speaks direct HTTP/1.1. Hosts requests would
+# reach through HTTP(S)_PROXY / NO_PROXY are probed with the
+# requests based helpers on a thread instead.
+# =====================================================
+
+# host_key -> True if behind a proxy; the environment is read once per host
+_PROXIED = {}
+
+
+def proxied(url):
+    host = host_key(url)
+
+    if host not in _PROXIED:
+        _PROXIED[host] = select_proxy(host, get_environ_proxies(host)) is not None
+
+    return _PROXIED[host]
+
+
+# =====================================================
+# PROBES (async twins of check_url / fetch_number)
+# =====================================================
+
+async def check_url(url):
+    try:
+        status, _ = await asyncio.wait_for(
+            http_get(url, read_body=False),
+            PROBE_TIMEOUT
+        )
+        return status < 400
+    except Exception:
+        return False
+
+
+async def fetch_number(url):
+    try:
+        _, body = await asyncio.wait_for(http_get(url), PROBE_TIMEOUT)
+        return int(body.strip())
+    except Exception:
+        return 0
+
+
+PROBES = {
+    "check": check_url,
+    "number": fetch_number
+}
+
+# Thread-bound twins for proxied hosts
+PROXY_PROBES = {
+    "check": probe.check_url,
+    "number": probe.fetch_number
+}
+
+
+# =====================================================
+# ENGINE
+# =====================================================
+
+class AsyncProbeEngine:
+    """
+    Owns an event loop running on a daemon thread.
+    Scheduler threads hand it a batch of probes and block
+    until the batch finishes or the deadline passes.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+
+        # result_key -> task, so concurrent batches share one probe
+        self.in_flight = {}
+
+        self.proxy_executor = ThreadPoolExecutor(
+            max_workers=PROXY_WORKERS,
+            thread_name_prefix="proxy-probe"
+        )
+
+        threading.Thread(
+            target=self._run_loop,
+            name="probe-loop",
+            daemon=True
+        ).start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._schedule_eviction()
+        self.loop.run_forever()
+
+    def _schedule_eviction(self):
+        evict_idle()
+        self.loop.call_later(IDLE_TIMEOUT / 2, self._schedule_eviction)
+
+    async def _probe_once(self, key, kind, url):
+        async with self.semaphore:
+            if proxied(url):
+                result = await self.loop.run_in_executor(
+                    self.proxy_executor, PROXY_PROBES[kind], url
+                )
+            else:
+                result = await PROBES[kind](url)
+
+        RESULTS.put(key, result)
+        return result
+
+    async def _probe(self, kind, url):
+        key = result_key(kind, url)
+
+        cached = RESULTS.get(key)
+        if cached is not MISS:
+            return cached
+
+        task = self.in_flight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._probe_once(key, kind, url))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        # A waiter hitting its deadline must not cancel the shared probe
+        return await asyncio.shield(task)
+
+    async def _run_batch(self, jobs, deadline):
+        tasks = {
+            asyncio.ensure_future(self._probe(kind, url)): key
+            for key, (kind, url) in jobs.items()
+        }
+
+        if not tasks:
+            return {}, 0
+
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        for task in pending:
+            task.cancel()
+
+        return {tasks[t]: t.result() for t in done}, len(pending)
+
+    def submit(self, jobs, deadline):
+        """
+        Non-blocking: returns a concurrent.futures.Future resolving to
+        ({key: result}, number_of_probes_dropped)
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._run_batch(jobs, deadline),
+            self.loop
+        )
+
+    def run_probes(self, jobs, deadline):
+        """
+        jobs: {key: (kind, url)} where kind is "check" or "number"
+        Returns ({key: result}, number_of_probes_dropped)
+        """
+        return self.submit(jobs, deadline).result()
@@ -0,0 +1,435 @@
+"""
+history.py
+Probe result history in compressed hourly blocks
+One HistoryBlock row per target per hour (Gorilla style encoding):
+timestamps as delta-of-delta, integer readings as delta-of-delta,
+float readings XOR'ed with the previous value, all bit packed.
+"opt" columns are non-negative integers that may be missing (None);
+"gap" columns are optional seconds close to the timestamp delta, stored
+as their millisecond difference from it.
+"""
+
+import struct
+import threading
+import time
+
+from sqlalchemy.dialects.sqlite import insert
+
+from metrics import Counter, Gauge
+from models import db, HistoryBlock
+from writer import WRITER
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+BLOCK_SPAN = 3600        # seconds covered by one block
+MAX_PENDING = 10000      # sealed blocks waiting for a flush (oldest dropped)
+
+# Readings kept per target kind, in encoding order
+FIELDS = {
+    "app": (
+        ("healthy", "int"),
+        ("active_users", "int")
+    ),
+    "endpoint": (
+        ("reachable", "int"),
+        ("total", "int"),
+        ("failed", "int"),
+        # Counter increases and the seconds they cover (rate = increase /
+        # elapsed); None without a baseline (restart, failed counter read)
+        ("total_increase", "opt"),
+        ("failed_increase", "opt"),
+        ("elapsed", "gap")
+    )
+}
+
+NO_VALUE = -1     # how an "opt" column stores None
+
+
+# =====================================================
+# BIT PACKING
+# =====================================================
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.nbits = 0
+
+    def write(self, bits, n):
+        self.value = (self.value << n) | (bits & ((1 << n) - 1))
+        self.nbits += n
+
+    def to_bytes(self):
+        pad = -self.nbits % 8
+        return (self.value << pad).to_bytes((self.nbits + pad) // 8, "big")
+
+
+class BitReader:
+    def __init__(self, data):
+        self.value = int.from_bytes(data, "big")
+        self.left = len(data) * 8
+
+    def read(self, n):
+        self.left -= n
+        return (self.value >> self.left) & ((1 << n) - 1)
+
+    def read_signed(self, n):
+        v = self.read(n)
+        return v - (1 << n) if v >> (n - 1) else v
+
+
+# Delta-of-delta classes: "0" for an unchanged delta, otherwise
+# N one bits ("10", "110", ... "11111") then a signed value of _DOD_BITS[N-1].
+# The widest class holds the delta-of-delta of any two int64 swings.
+_DOD_BITS = (7, 9, 12, 32, 68)
+
+INT_MIN, INT_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _write_dod(w, v):
+    if v == 0:
+        w.write(0, 1)
+        return
+
+    for ones, n in enumerate(_DOD_BITS, 1):
+        if -(1 << (n - 1)) <= v < (1 << (n - 1)):
+            w.write((1 << ones) - 1, ones)
+            if ones < len(_DOD_BITS):
+                w.write(0, 1)
+            w.write(v, n)
+            return
+
+    raise ValueError(f"value out of range: {v}")
+
+
+def _read_dod(r):
+    ones = 0
+    while ones < len(_DOD_BITS) and r.read(1):
+        ones += 1
+
+    if ones == 0:
+        return 0
+    return r.read_signed(_DOD_BITS[ones - 1])
+
+
+def _float_bits(v):
+    return struct.unpack(">Q", struct.pack(">d", v))[0]
+
+
+def _bits_float(b):
+    return struct.unpack(">d", struct.pack(">Q", b))[0]
+
+
+# =====================================================
+# BLOCK CODEC
+# =====================================================
+
+class _Column:
+    """Encoder / decoder state of one field within a block"""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.prev = 0            # int value, or float bit pattern
+        self.delta = 0           # int codec
+        self.window = None       # float codec: (leading, trailing) zeros
+
+    def write(self, w, value, gap):
+        if self.codec == "gap":
+            # 0 for None, else 1 and the difference from the timestamp
+            # delta (jitter XORs badly as a float, ~60 bits a sample)
+            w.write(value is not None, 1)
+            if value is not None:
+                _write_dod(w, round(value * 1000) - gap * 1000)
+            return
+
+        if self.codec == "opt":
+            value = NO_VALUE if value is None else value
+
+        if self.codec in ("int", "opt"):
+            value = min(max(int(value), INT_MIN), INT_MAX)
+            delta = value - self.prev
+            _write_dod(w, delta - self.delta)
+            self.prev, self.delta = value, delta
+            return
+
+        bits = _float_bits(float(value))
+        x = bits ^ self.prev
+        self.prev = bits
+
+        if x == 0:
+            w.write(0, 1)
+            return
+
+        leading = min(64 - x.bit_length(), 31)
+        trailing = (x & -x).bit_length() - 1
+
+        if self.window and leading >= self.window[0] and trailing >= self.window[1]:
+            lead, trail = self.window
+            w.write(0b10, 2)
+            w.write(x >> trail, 64 - lead - trail)
+            return
+
+        size = 64 - leading - trailing
+        w.write(0b11, 2)
+        w.write(leading, 5)
+        w.write(size & 63, 6)     # 64 meaningful bits stored as 0
+        w.write(x >> trailing, size)
+        self.window = (leading, trailing)
+
+    def read(self, r, gap):
+        if self.codec == "gap":
+            return (gap * 1000 + _read_dod(r)) / 1000 if r.read(1) else None
+
+        if self.codec in ("int", "opt"):
+            self.delta += _read_dod(r)
+            self.prev += self.delta
+            if self.codec == "opt" and self.prev == NO_VALUE:
+                return None
+            return self.prev
+
+        if r.read(1):
+            if r.read(1):
+                leading = r.read(5)
+                size = r.read(6) or 64
+                self.window = (leading, 64 - leading - size)
+
+            lead, trail = self.window
+            self.prev ^= r.read(64 - lead - trail) << trail
+
+        return _bits_float(self.prev)
+
+
+def _parse_fields(fields):
+    return tuple(tuple(f.split(":")) for f in fields.split(","))
+
+
+def decode(fields, start, count, data):
+    """[(timestamp, {field: value}), ...] of an encoded block"""
+    fields = _parse_fields(fields) if isinstance(fields, str) else fields
+    r = BitReader(data)
+    columns = [_Column(codec) for _, codec in fields]
+
+    ts, delta = start, 0
+    samples = []
+
+    for _ in range(count):
+        delta += _read_dod(r)
+        ts += delta
+        samples.append((ts, {
+            name: col.read(r, delta) for (name, _), col in zip(fields, columns)
+        }))
+
+    return samples
+
+
+class Block:
+    """An hour of one target's readings, appended in time order"""
+
+    def __init__(self, kind, entity_id, start, fields):
+        self.kind = kind
+        self.entity_id = entity_id
+        self.start = start
+        self.fields = fields
+        self.count = 0
+        self.dirty = False
+
+        self._bits = BitWriter()
+        self._ts = start
+        self._delta = 0
+        self._columns = [_Column(codec) for _, codec in fields]
+
+    def append(self, ts, reading):
+        ts = max(int(ts), self._ts)     # never go back in time
+        delta = ts - self._ts
+        _write_dod(self._bits, delta - self._delta)
+        self._ts, self._delta = ts, delta
+
+        for (name, codec), col in zip(self.fields, self._columns):
+            value = reading.get(name)
+            if codec not in ("opt", "gap"):
+                value = value or 0
+            col.write(self._bits, value, delta)
+
+        self.count += 1
+        self.dirty = True
+
+    def samples(self):
+        return decode(self.fields, self.start, self.count, self._bits.to_bytes())
+
+    def row(self):
+        return {
+            "kind": self.kind,
+            "entity_id": self.entity_id,
+            "start": self.start,
+            "fields": ",".join(f"{n}:{c}" for n, c in self.fields),
+            "count": self.count,
+            "data": self._bits.to_bytes()
+        }
+
+
+# =====================================================
+# STORE
+# Appends happen in memory from any thread; flush() queues the
+# sealed blocks plus the changed open ones on the writer thread.
+# =====================================================
+
+_OPEN = {}        # (kind, entity_id) -> Block of the current hour
+_SEALED = []      # finished blocks not yet written
+_LOCK = threading.Lock()
+
+# Rewrites the whole block: open blocks are re-sent as they grow
+UPSERT_BLOCK = insert(HistoryBlock.__table__)
+UPSERT_BLOCK = UPSERT_BLOCK.on_conflict_do_update(
+    index_elements=["kind", "entity_id", "start"],
+    set_={
+        "fields": UPSERT_BLOCK.excluded.fields,
+        "count": UPSERT_BLOCK.excluded.count,
+        "data": UPSERT_BLOCK.excluded.data
+    }
+)
+
+
+def _seal(block):
+    _SEALED.append(block)
+
+    if len(_SEALED) > MAX_PENDING:
+        dropped = _SEALED.pop(0)
+        print(f"[History] Dropped unwritten block {dropped.kind} {dropped.entity_id}")
+
+
+def record(kind, entity_id, ts, reading):
+    """Appends one reading (dict with the FIELDS of its kind)"""
+    ts = int(ts)
+    start = ts - ts % BLOCK_SPAN
+    key = (kind, entity_id)
+
+    with _LOCK:
+        block = _OPEN.get(key)
+
+        if block is not None and block.start != start:
+            if start < block.start:
+                return      # late reading for an hour already sealed
+            _seal(_OPEN.pop(key))
+            block = None
+
+        if block is None:
+            block = _OPEN[key] = Block(kind, entity_id, start, FIELDS[kind])
+
+        block.append(ts, reading)
+
+
+def resume():
+    """
+    Reloads the current hour's blocks written before a restart so
+    the next flush extends them instead of overwriting them.
+    Call once before the first flush (inside an app context).
+    """
+    now = int(time.time())
+    start = now - now % BLOCK_SPAN
+
+    for row in HistoryBlock.query.filter_by(start=start).all():
+        samples = decode(row.fields, row.start, row.count, row.data)
+        key = (row.kind, row.entity_id)
+
+        with _LOCK:
+            current = _OPEN.get(key)
+            if current is not None and current.start == start:
+                samples += current.samples()
+
+            block = Block(row.kind, row.entity_id, start, FIELDS[row.kind])
+            for ts, reading in samples:
+                block.append(ts, reading)
+            _OPEN[key] = block
+
+    db.session.remove()
+
+
+def flush():
+    """
+    Hands sealed and changed blocks to the write-behind writer;
+    returns the rows queued. Never touches the database itself.
+    """
+    now = time.time()
+
+    with _LOCK:
+        for key, block in list(_OPEN.items()):
+            if block.start + BLOCK_SPAN <= now:
+                _seal(_OPEN.pop(key))
+
+        blocks = list(_SEALED) + [b for b in _OPEN.values() if b.dirty]
+        _SEALED.clear()
+
+        rows = [b.row() for b in blocks]
+        for b in blocks:
+            b.dirty = False
+
+    queued = WRITER.put_many(UPSERT_BLOCK, rows)
+
+    if queued < len(rows):
+        # Writer backlog: keep the rest for the next flush
+        with _LOCK:
+            for b in blocks[queued:]:
+                b.dirty = True
+                if _OPEN.get((b.kind, b.entity_id)) is not b:
+                    _seal(b)
+
+    BLOCKS_FLUSHED.inc(queued)
+    return queued
+
+
+def query(kind, entity_id, since, until):
+    """[(timestamp, {field: value}), ...] between since and until"""
+    first = int(since) - int(since) % BLOCK_SPAN
+
+    rows = (
+        HistoryBlock.query
+        .filter(
+            HistoryBlock.kind == kind,
+            HistoryBlock.entity_id == entity_id,
+            HistoryBlock.start >= first,
+            HistoryBlock.start <= until
+        )
+        .all()
+    )
+    blocks = {
+        row.start: decode(row.fields, row.start, row.count, row.data)
+        for row in rows
+    }
+
+    # Unwritten blocks are newer than their DB copy
+    with _LOCK:
+        pending = [
+            b for b in _SEALED + [_OPEN.get((kind, entity_id))]
+            if b is not None and b.kind == kind and b.entity_id == entity_id
+        ]
+        for b in pending:
+            if first <= b.start <= until:
+                blocks[b.start] = b.samples()
+
+    return [
+        (ts, reading)
+        for start in sorted(blocks)
+        for ts, reading in blocks[start]
+        if since <= ts <= until
+    ]
+
+
+# =====================================================
+# INSTRUMENTATION
+# =====================================================
+
+BLOCKS_FLUSHED = Counter(
+    "history_blocks_flushed_total",
+    "History block rows handed to the write-behind writer"
+)
+Gauge(
+    "history_open_blocks",
+    "Targets with an hourly history block in memory",
+    func=lambda: len(_OPEN)
+)
+Gauge(
+    "history_pending_blocks",
+    "Sealed history blocks waiting for a flush",
+    func=lambda: len(_SEALED)
+)
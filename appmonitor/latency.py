@@ -0,0 +1,139 @@
+"""
+latency.py
+Per-target response time tracking
+Recent samples plus sliding-window p50 / p95 / p99 in bounded memory
+"""
+
+import math
+import threading
+import time
+
+from collections import OrderedDict, deque
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+RECENT_SAMPLES = 120     # raw samples kept per target (about 1 h at 30 s)
+WINDOW = 900             # seconds; percentiles cover the last 1-2 windows
+PRECISION = 0.02         # relative bucket width of the log histogram
+MIN_MS = 0.1             # smaller samples land in the first bucket
+MAX_TARGETS = 20000      # tracked URLs (LRU beyond that)
+
+_LOG_BASE = math.log(1 + PRECISION)
+
+
+# =====================================================
+# LOG HISTOGRAM (HDR style)
+# =====================================================
+
+class LogHistogram:
+    """
+    Buckets grow geometrically, so any quantile is accurate to
+    PRECISION whatever the range (0.1 ms .. minutes) and memory is
+    a few hundred ints at most.
+    """
+
+    def __init__(self):
+        self.counts = {}     # bucket index -> samples
+        self.total = 0
+
+    def add(self, ms):
+        i = int(math.log(max(ms, MIN_MS) / MIN_MS) / _LOG_BASE)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.total += 1
+
+    def merged(self, other):
+        h = LogHistogram()
+        for src in (self, other):
+            for i, n in src.counts.items():
+                h.counts[i] = h.counts.get(i, 0) + n
+            h.total += src.total
+        return h
+
+    def quantile(self, q):
+        if not self.total:
+            return None
+
+        rank = q * self.total
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                # Midpoint of the bucket
+                return round(MIN_MS * (1 + PRECISION) ** (i + 0.5), 1)
+
+
+# =====================================================
+# PER-TARGET STATS
+# =====================================================
+
+class LatencyStats:
+    def __init__(self):
+        # (timestamp, total_ms, ttfb_ms, connect_ms)
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+        self.current = LogHistogram()
+        self.previous = LogHistogram()
+        self.window_started = time.time()
+
+    def record(self, total_ms, ttfb_ms=None, connect_ms=None):
+        now = time.time()
+
+        if now - self.window_started > WINDOW:
+            self.previous, self.current = self.current, LogHistogram()
+            self.window_started = now
+
+        self.current.add(total_ms)
+        self.recent.append((now, total_ms, ttfb_ms, connect_ms))
+
+    def summary(self):
+        if not self.recent:
+            return None
+
+        _, total_ms, ttfb_ms, connect_ms = self.recent[-1]
+        window = self.current.merged(self.previous)
+
+        return {
+            "last_ms": round(total_ms, 1),
+            "ttfb_ms": round(ttfb_ms, 1) if ttfb_ms is not None else None,
+            "connect_ms": round(connect_ms, 1) if connect_ms is not None else None,
+            "p50_ms": window.quantile(0.50),
+            "p95_ms": window.quantile(0.95),
+            "p99_ms": window.quantile(0.99),
+            "samples": window.total
+        }
+
+
+# Keyed by probe.normalize_url(url)
+_STATS = OrderedDict()       # url -> LatencyStats
+_LOCK = threading.Lock()
+
+
+def record(key, total_s, ttfb_s=None, connect_s=None):
+    """Called by the probe clients after every completed request"""
+    with _LOCK:
+        stats = _STATS.get(key)
+        if stats is None:
+            stats = _STATS[key] = LatencyStats()
+            if len(_STATS) > MAX_TARGETS:
+                _STATS.popitem(last=False)
+        _STATS.move_to_end(key)
+
+        stats.record(
+            total_s * 1000,
+            ttfb_s * 1000 if ttfb_s is not None else None,
+            connect_s * 1000 if connect_s is not None else None
+        )
+
+
+def summary(key):
+    with _LOCK:
+        stats = _STATS.get(key)
+        return stats.summary() if stats else None
+
+
+def recent(key):
+    """[[timestamp, total_ms, ttfb_ms, connect_ms], ...] oldest first"""
+    with _LOCK:
+        stats = _STATS.get(key)
+        return [list(s) for s in stats.recent] if stats else []
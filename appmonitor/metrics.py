@@ -0,0 +1,178 @@
+"""
+metrics.py
+In-process counters, gauges and histograms
+Cheap enough to update from probe / scheduler hot paths
+"""
+
+import bisect
+import threading
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+# Upper bounds in seconds; +Inf is implicit
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60
+)
+
+REGISTRY = []
+
+# Latest Prometheus text exposition, rebuilt by publish()
+EXPOSITION = b""
+
+
+# =====================================================
+# METRIC TYPES
+# =====================================================
+
+class Counter:
+    """Incremented explicitly or read from an existing tally via func"""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.value = 0
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.func() if self.func else self.value
+
+
+class Gauge:
+    """Either set explicitly or computed on read via func"""
+
+    type = "gauge"
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.value = 0
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def snapshot(self):
+        return self.func() if self.func else self.value
+
+
+class Histogram:
+    """Fixed buckets, cumulative on read (Prometheus style)"""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        cumulative = []
+        running = 0
+        for bound, n in zip(self.buckets + ("+Inf",), counts):
+            running += n
+            cumulative.append((bound, running))
+
+        return {
+            "buckets": cumulative,
+            "sum": round(total, 6),
+            "count": count
+        }
+
+
+def snapshot_all():
+    """{metric name: value / histogram dict} for JSON endpoints"""
+    return {m.name: m.snapshot() for m in REGISTRY}
+
+
+# =====================================================
+# PROMETHEUS TEXT EXPOSITION
+# =====================================================
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def family(name, help_text, metric_type, samples):
+    """Lines for one metric family; samples: [(labels, value), ...]"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    return lines
+
+
+def render_registry():
+    lines = []
+
+    for m in REGISTRY:
+        value = m.snapshot()
+
+        if m.type != "histogram":
+            lines += family(m.name, m.help, m.type, [({}, value)])
+            continue
+
+        lines += [f"# HELP {m.name} {m.help}", f"# TYPE {m.name} histogram"]
+        for bound, count in value["buckets"]:
+            lines.append(f'{m.name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{m.name}_sum {value['sum']}")
+        lines.append(f"{m.name}_count {value['count']}")
+
+    return lines
+
+
+def publish(extra_lines=()):
+    """
+    Renders the registry plus extra_lines once and keeps the bytes,
+    so /metrics scrapes cost a memory read whatever the series count.
+    """
+    global EXPOSITION
+    lines = render_registry() + list(extra_lines)
+    EXPOSITION = ("\n".join(lines) + "\n").encode("utf-8")
+    return EXPOSITION
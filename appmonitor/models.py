@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event, inspect, text
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -24,6 +25,9 @@ class User(db.Model, UserMixin):
 
 class Application(db.Model):
     __tablename__ = "applications"
+    __table_args__ = (
+        db.Index("ix_applications_is_active", "is_active"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -34,6 +38,10 @@ class Application(db.Model):
     app_health_url = db.Column(db.String(400), nullable=False)
     active_users_url = db.Column(db.String(400), nullable=False)
 
+    # Adaptive polling bounds in seconds (NULL = scheduler default)
+    min_poll_interval = db.Column(db.Integer)
+    max_poll_interval = db.Column(db.Integer)
+
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -50,6 +58,10 @@ class Application(db.Model):
 
 class Interface(db.Model):
     __tablename__ = "interfaces"
+    __table_args__ = (
+        # Also serves lookups / joins on source_app_id alone
+        db.Index("ix_interfaces_source_app_active", "source_app_id", "is_active"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -84,6 +96,10 @@ class Interface(db.Model):
 
 class InterfaceEndpoint(db.Model):
     __tablename__ = "interface_endpoints"
+    __table_args__ = (
+        # Endpoint of one interface by direction; joins on interface_id
+        db.Index("ix_interface_endpoints_interface_direction", "interface_id", "direction"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -100,6 +116,10 @@ class InterfaceEndpoint(db.Model):
     transaction_count_url = db.Column(db.String(400), nullable=False)
     error_count_url = db.Column(db.String(400), nullable=False)
 
+    # Adaptive polling bounds in seconds (NULL = scheduler default)
+    min_poll_interval = db.Column(db.Integer)
+    max_poll_interval = db.Column(db.Integer)
+
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -110,6 +130,9 @@ class InterfaceEndpoint(db.Model):
 
 class AuditLog(db.Model):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        db.Index("ix_audit_logs_timestamp", "timestamp"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -122,3 +145,151 @@ class AuditLog(db.Model):
     notes = db.Column(db.Text)
 
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# =====================================================
+# CONFIG CHANGE FEED
+# Written with every admin change to the topology; the id is the
+# config version readers catch up to.
+# =====================================================
+
+class ConfigChange(db.Model):
+    __tablename__ = "config_changes"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # "app", "interface" or "endpoint" and the changed row
+    kind = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+
+    # Application owning the row (what readers reload)
+    app_id = db.Column(db.Integer, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# =====================================================
+# PROBE HISTORY (one compressed block per target per hour)
+# =====================================================
+
+class HistoryBlock(db.Model):
+    __tablename__ = "history_blocks"
+    __table_args__ = (
+        db.UniqueConstraint("kind", "entity_id", "start"),
+        # Raw retention pruning (start < cutoff across all targets)
+        db.Index("ix_history_blocks_start", "start"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # "app" (Application.id) or "endpoint" (InterfaceEndpoint.id)
+    kind = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+
+    # Epoch seconds of the hour the block covers
+    start = db.Column(db.Integer, nullable=False)
+
+    # "name:codec,..." in encoding order, so old blocks stay readable
+    fields = db.Column(db.String(200), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+
+class HistoryRollup(db.Model):
+    __tablename__ = "history_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("kind", "entity_id", "tier", "start"),
+        # Per-tier retention pruning
+        db.Index("ix_history_rollups_tier_start", "tier", "start"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    kind = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+
+    # "1m", "1h" or "1d"; start is the bucket's epoch second
+    tier = db.Column(db.String(5), nullable=False)
+    start = db.Column(db.Integer, nullable=False)
+
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    up = db.Column(db.Integer, nullable=False, default=0)   # healthy / reachable
+
+    # Applications
+    users_min = db.Column(db.Integer)
+    users_max = db.Column(db.Integer)
+    users_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    # Interface endpoints
+    total_sum = db.Column(db.Integer, nullable=False, default=0)
+    failed_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    # Counter increases and the seconds they cover (rate = increase / elapsed)
+    total_increase = db.Column(db.Integer)
+    failed_increase = db.Column(db.Integer)
+    elapsed = db.Column(db.Float)
+
+
+# =====================================================
+# SQLITE SETTINGS (applied to every new connection)
+# =====================================================
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",      # readers and the writer stop blocking each other
+    # fsync at checkpoints only: always consistent, but a power loss
+    # can roll back the last few commits
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,     # read up to 256 MB of the file through mmap
+    "busy_timeout": 5000        # ms to wait for a lock before "database is locked"
+}
+
+
+def enable_sqlite_pragmas(engine):
+    """Registers SQLITE_PRAGMAS on an engine; call before first use"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+# =====================================================
+# SCHEMA UPGRADE (existing monitor.db files)
+# =====================================================
+
+def upgrade_schema():
+    """
+    Create missing tables, and add columns and indexes introduced
+    after an existing database was created. Call inside an app
+    context. New columns must be nullable (SQLite ADD COLUMN limitation).
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+
+    for table in db.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            ddl = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(
+                f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {ddl}'
+            ))
+            print(f"[DB] Added column {table.name}.{column.name}")
+
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine, checkfirst=True)
+                print(f"[DB] Created index {index.name}")
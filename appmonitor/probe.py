@@ -0,0 +1,435 @@
+"""
+probe.py
+Shared HTTP probe client
+Used by the UI (on-demand checks) and the scheduler
+"""
+
+import threading
+import time
+import requests
+
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit, urlunsplit
+
+import latency
+from metrics import Counter, Gauge, Histogram
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+PROBE_TIMEOUT = 5            # seconds
+
+POOL_MAXSIZE = 4             # keep-alive connections kept per target host
+MAX_HOSTS = 500              # pooled hosts kept at once (LRU beyond that)
+IDLE_TIMEOUT = 120           # seconds before an unused host pool is closed
+EVICT_EVERY = 30             # seconds between idle sweeps
+
+USER_AGENT = "Monitoring-Portal"
+
+# Seconds a probe result is reused; kept below the smallest poll
+# interval (scheduler.MIN_POLL_INTERVAL) so a target re-polled at its
+# minimum after a failure or change always gets a fresh probe
+RESULT_CACHE_TTL = 4
+RESULT_CACHE_SIZE = 10000    # entries kept (LRU beyond that)
+
+BREAKER_THRESHOLD = 3        # consecutive connect failures before opening
+BREAKER_BACKOFF = 30         # seconds before the first half-open trial
+BREAKER_MAX_BACKOFF = 600    # backoff doubles per failed trial up to this
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def host_key(url):
+    """
+    scheme://host:port with the default port filled in - one pool
+    and one circuit per key (same host / port as the async pool key)
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    port = parts.port or DEFAULT_PORTS.get(scheme)
+    return f"{scheme}://{(parts.hostname or '').lower()}:{port}"
+
+
+def normalize_url(url):
+    """
+    Same target, same key: lower-case scheme/host, no default
+    port, no fragment, "/" for an empty path.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username:
+        host = f"{parts.netloc.rsplit('@', 1)[0]}@{host}"
+
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def result_key(kind, url):
+    """Cache / single-flight key of a probe ("check" or "number", url)"""
+    return kind, normalize_url(url)
+
+
+# =====================================================
+# CIRCUIT BREAKER (per target host)
+# =====================================================
+
+class HostUnavailable(Exception):
+    """Raised instead of probing a host whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    After BREAKER_THRESHOLD consecutive connect failures a host is
+    "open": probes fail instantly instead of waiting for a timeout.
+    Once the backoff expires a single half-open trial probe is let
+    through; success closes the circuit, failure reopens it with a
+    doubled backoff.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, backoff=BREAKER_BACKOFF,
+                 max_backoff=BREAKER_MAX_BACKOFF):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # host -> {"failures", "open_until", "backoff", "trial"}
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+
+            if state is None or state["open_until"] is None:
+                return True
+
+            if state["trial"] or time.monotonic() < state["open_until"]:
+                return False
+
+            state["trial"] = True      # half-open: this caller is the trial
+            return True
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._hosts.pop(host, None)
+
+        if state and state["open_until"] is not None:
+            print(f"[Probe] Circuit closed for {host}")
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, {
+                "failures": 0,
+                "open_until": None,
+                "backoff": self.backoff,
+                "trial": False
+            })
+            state["failures"] += 1
+
+            if state["failures"] < self.threshold:
+                return
+
+            if state["open_until"] is not None and not state["trial"]:
+                return      # already open, a probe started before it opened
+
+            if state["trial"]:
+                state["backoff"] = min(state["backoff"] * 2, self.max_backoff)
+
+            state["open_until"] = time.monotonic() + state["backoff"]
+            state["trial"] = False
+            backoff = state["backoff"]
+
+        print(f"[Probe] Circuit open for {host}, next trial in {backoff}s")
+
+    def open_hosts(self):
+        with self._lock:
+            return [h for h, s in self._hosts.items() if s["open_until"] is not None]
+
+
+BREAKER = CircuitBreaker()
+
+
+# =====================================================
+# CLIENT
+# =====================================================
+
+class ProbeClient:
+    """
+    Keeps one requests.Session per target host so the connectivity,
+    transaction and error URLs of an endpoint share keep-alive
+    connections instead of paying a TCP/TLS handshake each.
+    """
+
+    def __init__(self, pool_maxsize=POOL_MAXSIZE, max_hosts=MAX_HOSTS,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.pool_maxsize = pool_maxsize
+        self.max_hosts = max_hosts
+        self.idle_timeout = idle_timeout
+
+        self._sessions = {}          # host -> [session, last_used]
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _new_session(self):
+        s = requests.Session()
+        s.verify = False
+        s.headers["User-Agent"] = USER_AGENT
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize
+        )
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        return s
+
+    def _session_for(self, url):
+        key = host_key(url)
+        now = time.monotonic()
+        stale = []
+
+        with self._lock:
+            if now - self._last_sweep > EVICT_EVERY:
+                stale = self._pop_idle(now)
+                self._last_sweep = now
+
+            entry = self._sessions.get(key)
+
+            if entry is None:
+                if len(self._sessions) >= self.max_hosts:
+                    oldest = min(self._sessions, key=lambda k: self._sessions[k][1])
+                    stale.append(self._sessions.pop(oldest)[0])
+
+                entry = self._sessions[key] = [self._new_session(), now]
+
+            entry[1] = now
+            session = entry[0]
+
+        for s in stale:
+            s.close()
+
+        return session
+
+    def _pop_idle(self, now):
+        idle = [
+            k for k, (_, last_used) in self._sessions.items()
+            if now - last_used > self.idle_timeout
+        ]
+        return [self._sessions.pop(k)[0] for k in idle]
+
+    def get(self, url, timeout=PROBE_TIMEOUT):
+        host = host_key(url)
+
+        if not BREAKER.allow(host):
+            raise HostUnavailable(host)
+
+        started = time.perf_counter()
+        try:
+            r = self._session_for(url).get(url, timeout=timeout)
+        except requests.ConnectionError:
+            BREAKER.record_failure(host)
+            raise
+        except Exception:
+            # Connected but slow / broken answer: the host itself is up
+            BREAKER.record_success(host)
+            raise
+        finally:
+            PROBE_DURATION.observe(time.perf_counter() - started)
+
+        BREAKER.record_success(host)
+
+        # r.elapsed stops at the response headers (TTFB); urllib3 does
+        # not expose the connect time on its own
+        latency.record(
+            normalize_url(url),
+            time.perf_counter() - started,
+            ttfb_s=r.elapsed.total_seconds()
+        )
+        return r
+
+    def close(self):
+        with self._lock:
+            sessions = [s for s, _ in self._sessions.values()]
+            self._sessions.clear()
+
+        for s in sessions:
+            s.close()
+
+
+CLIENT = ProbeClient()
+
+
+# =====================================================
+# RESULT CACHE (TTL + LRU)
+# =====================================================
+
+MISS = object()
+
+
+class ResultCache:
+    """
+    Probe results keyed by result_key(). Many endpoints share one
+    gateway health URL; within the TTL they all reuse one reading.
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_size=RESULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()    # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return MISS
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+RESULTS = ResultCache()
+
+
+# =====================================================
+# INSTRUMENTATION
+# =====================================================
+
+PROBE_DURATION = Histogram(
+    "probe_duration_seconds",
+    "Wall time of one outbound probe request"
+)
+Counter(
+    "probe_cache_hits_total",
+    "Probe results served from the result cache",
+    func=lambda: RESULTS.hits
+)
+Counter(
+    "probe_cache_misses_total",
+    "Probe results not found in the result cache",
+    func=lambda: RESULTS.misses
+)
+Gauge(
+    "probe_cache_hit_ratio",
+    "Result cache hits / lookups since start",
+    func=lambda: round(RESULTS.hits / max(1, RESULTS.hits + RESULTS.misses), 4)
+)
+Gauge(
+    "probe_circuits_open",
+    "Target hosts whose circuit breaker is open",
+    func=lambda: len(BREAKER.open_hosts())
+)
+
+
+# =====================================================
+# SINGLE-FLIGHT
+# =====================================================
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """
+    Concurrent callers asking for the same key wait on the one
+    call already in flight and share its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            return call.result
+
+        try:
+            call.result = func(*args)
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+FLIGHTS = SingleFlight()
+
+
+# =====================================================
+# PROBES
+# =====================================================
+
+def _check_url(url):
+    try:
+        r = CLIENT.get(url)
+        return r.status_code < 400
+    except Exception:
+        return False
+
+
+def _fetch_number(url):
+    try:
+        r = CLIENT.get(url)
+        return int(r.text.strip())
+    except Exception:
+        return 0
+
+
+def _cached(kind, func, url):
+    key = result_key(kind, url)
+
+    value = RESULTS.get(key)
+    if value is not MISS:
+        return value
+
+    def probe_and_store():
+        result = func(url)
+        RESULTS.put(key, result)
+        return result
+
+    return FLIGHTS.do(key, probe_and_store)
+
+
+def check_url(url):
+    """Generic URL health check"""
+    return _cached("check", _check_url, url)
+
+
+def fetch_number(url):
+    """Fetch numeric metric from API"""
+    return _cached("number", _fetch_number, url)
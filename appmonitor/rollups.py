@@ -0,0 +1,306 @@
+"""
+rollups.py
+Per-minute / hour / day aggregates of probe history
+Maintained incrementally as readings arrive; each tier is pruned
+to its own retention by a periodic compaction pass.
+"""
+
+import threading
+import time
+
+from sqlalchemy import bindparam, delete, func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import HistoryBlock, HistoryRollup
+from writer import WRITER
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+DAY = 86400
+
+# tier -> (bucket seconds, retention seconds)
+TIERS = {
+    "1m": (60, 7 * DAY),
+    "1h": (3600, 180 * DAY),
+    "1d": (DAY, 5 * 365 * DAY)
+}
+
+RAW_RETENTION = 35 * DAY    # history_blocks kept this long
+COMPACT_EVERY = 3600        # seconds between compaction passes
+
+# Reading field counted as "up" per target kind
+UP_FIELD = {"app": "healthy", "endpoint": "reachable"}
+
+
+# =====================================================
+# BUCKETS
+# =====================================================
+
+class Bucket:
+    """
+    Aggregates of one target / tier / bucket not yet flushed.
+    Flushes send these as deltas and reset them, so the stored
+    row is always the sum of every flush (restart safe).
+    """
+
+    def __init__(self, kind, entity_id, tier, start):
+        self.kind = kind
+        self.entity_id = entity_id
+        self.tier = tier
+        self.start = start
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.up = 0
+        self.users_min = None
+        self.users_max = None
+        self.users_sum = 0
+        self.total_sum = 0
+        self.failed_sum = 0
+        self.total_increase = 0
+        self.failed_increase = 0
+        self.elapsed = 0.0
+
+    def add(self, reading):
+        self.samples += 1
+        self.up += int(bool(reading.get(UP_FIELD[self.kind])))
+
+        if self.kind == "app":
+            users = int(reading.get("active_users") or 0)
+            self.users_min = users if self.users_min is None else min(self.users_min, users)
+            self.users_max = users if self.users_max is None else max(self.users_max, users)
+            self.users_sum += users
+        else:
+            self.total_sum += int(reading.get("total") or 0)
+            self.failed_sum += int(reading.get("failed") or 0)
+
+            # Intervals without a counter baseline add nothing
+            if reading.get("total_increase") is not None:
+                self.total_increase += reading["total_increase"]
+                self.failed_increase += reading.get("failed_increase") or 0
+                self.elapsed += reading["elapsed"]
+
+    def row(self):
+        return {
+            "kind": self.kind,
+            "entity_id": self.entity_id,
+            "tier": self.tier,
+            "start": self.start,
+            "samples": self.samples,
+            "up": self.up,
+            "users_min": self.users_min,
+            "users_max": self.users_max,
+            "users_sum": self.users_sum,
+            "total_sum": self.total_sum,
+            "failed_sum": self.failed_sum,
+            "total_increase": self.total_increase,
+            "failed_increase": self.failed_increase,
+            "elapsed": round(self.elapsed, 3)
+        }
+
+
+_SUMMED = (
+    "samples", "up", "users_sum", "total_sum", "failed_sum",
+    "total_increase", "failed_increase", "elapsed"
+)
+
+
+def _merged(a, b):
+    """Row dict a plus the deltas of row dict b"""
+    out = dict(a)
+    for k in _SUMMED:
+        out[k] = (a[k] or 0) + (b[k] or 0)
+    for k, pick in (("users_min", min), ("users_max", max)):
+        values = [v for v in (a[k], b[k]) if v is not None]
+        out[k] = pick(values) if values else None
+    return out
+
+
+# =====================================================
+# STORE
+# =====================================================
+
+_OPEN = {}        # (kind, entity_id, tier) -> Bucket
+_SEALED = []      # buckets closed since the last flush
+_LOCK = threading.Lock()
+
+_T = HistoryRollup.__table__
+
+# Adds a delta to the stored bucket (or creates it)
+UPSERT_ROLLUP = insert(_T)
+UPSERT_ROLLUP = UPSERT_ROLLUP.on_conflict_do_update(
+    index_elements=["kind", "entity_id", "tier", "start"],
+    set_={
+        "samples": _T.c.samples + UPSERT_ROLLUP.excluded.samples,
+        "up": _T.c.up + UPSERT_ROLLUP.excluded.up,
+        "users_min": func.min(
+            func.coalesce(_T.c.users_min, UPSERT_ROLLUP.excluded.users_min),
+            func.coalesce(UPSERT_ROLLUP.excluded.users_min, _T.c.users_min)
+        ),
+        "users_max": func.max(
+            func.coalesce(_T.c.users_max, UPSERT_ROLLUP.excluded.users_max),
+            func.coalesce(UPSERT_ROLLUP.excluded.users_max, _T.c.users_max)
+        ),
+        "users_sum": _T.c.users_sum + UPSERT_ROLLUP.excluded.users_sum,
+        "total_sum": _T.c.total_sum + UPSERT_ROLLUP.excluded.total_sum,
+        "failed_sum": _T.c.failed_sum + UPSERT_ROLLUP.excluded.failed_sum,
+        # Nullable: added to existing databases by upgrade_schema()
+        "total_increase": func.coalesce(_T.c.total_increase, 0)
+                          + UPSERT_ROLLUP.excluded.total_increase,
+        "failed_increase": func.coalesce(_T.c.failed_increase, 0)
+                           + UPSERT_ROLLUP.excluded.failed_increase,
+        "elapsed": func.coalesce(_T.c.elapsed, 0) + UPSERT_ROLLUP.excluded.elapsed
+    }
+)
+
+PRUNE_TIER = delete(_T).where(
+    _T.c.tier == bindparam("prune_tier"),
+    _T.c.start < bindparam("before")
+)
+PRUNE_RAW = delete(HistoryBlock.__table__).where(
+    HistoryBlock.__table__.c.start < bindparam("before")
+)
+
+
+def record(kind, entity_id, ts, reading):
+    """Folds one reading into the open bucket of every tier"""
+    ts = int(ts)
+
+    with _LOCK:
+        for tier, (span, _) in TIERS.items():
+            start = ts - ts % span
+            key = (kind, entity_id, tier)
+            bucket = _OPEN.get(key)
+
+            if bucket is not None and bucket.start != start:
+                if start < bucket.start:
+                    # Late reading: goes out as its own delta
+                    late = Bucket(kind, entity_id, tier, start)
+                    late.add(reading)
+                    _SEALED.append(late)
+                    continue
+
+                _SEALED.append(_OPEN.pop(key))
+                bucket = None
+
+            if bucket is None:
+                bucket = _OPEN[key] = Bucket(kind, entity_id, tier, start)
+
+            bucket.add(reading)
+
+
+def flush():
+    """Queues the pending deltas on the writer; returns rows queued"""
+    now = time.time()
+
+    with _LOCK:
+        for key, bucket in list(_OPEN.items()):
+            if bucket.start + TIERS[bucket.tier][0] <= now:
+                _SEALED.append(_OPEN.pop(key))
+
+        rows = [b.row() for b in _SEALED]
+        rows += [b.row() for b in _OPEN.values() if b.samples]
+        _SEALED.clear()
+        for b in _OPEN.values():
+            b.reset()
+
+    queued = WRITER.put_many(UPSERT_ROLLUP, rows)
+
+    if queued < len(rows):
+        # Writer backlog: fold the refused deltas back in
+        with _LOCK:
+            for row in rows[queued:]:
+                late = Bucket(row["kind"], row["entity_id"], row["tier"], row["start"])
+                for k, v in row.items():
+                    setattr(late, k, v)
+                _SEALED.append(late)
+
+    return queued
+
+
+def compact():
+    """Queues deletion of rows past each tier's retention"""
+    now = int(time.time())
+
+    WRITER.put(PRUNE_RAW, {"before": now - RAW_RETENTION})
+    for tier, (_, retention) in TIERS.items():
+        WRITER.put(PRUNE_TIER, {"prune_tier": tier, "before": now - retention})
+
+
+# =====================================================
+# READS
+# =====================================================
+
+def query_many(kind, entity_ids, tier, since, until):
+    """
+    {entity_id: bucket rows (dicts)} of one tier for several targets
+    in one database query, stored plus not yet flushed
+    """
+    span = TIERS[tier][0]
+    first = int(since) - int(since) % span
+    ids = set(entity_ids)
+
+    rows = {entity_id: {} for entity_id in ids}
+    for r in HistoryRollup.query.filter(
+        HistoryRollup.kind == kind,
+        HistoryRollup.entity_id.in_(ids),
+        HistoryRollup.tier == tier,
+        HistoryRollup.start >= first,
+        HistoryRollup.start <= until
+    ):
+        rows[r.entity_id][r.start] = {
+            c.name: getattr(r, c.name) for c in _T.columns if c.name != "id"
+        }
+
+    with _LOCK:
+        pending = [
+            b.row() for b in _SEALED + [_OPEN.get((kind, i, tier)) for i in ids]
+            if b is not None and b.samples
+            and b.kind == kind and b.entity_id in ids and b.tier == tier
+        ]
+
+    for row in pending:
+        if first <= row["start"] <= until:
+            buckets = rows[row["entity_id"]]
+            old = buckets.get(row["start"])
+            buckets[row["start"]] = _merged(old, row) if old else row
+
+    return {
+        entity_id: [buckets[start] for start in sorted(buckets)]
+        for entity_id, buckets in rows.items()
+    }
+
+
+def query(kind, entity_id, tier, since, until):
+    """Bucket rows (dicts) of one tier, stored plus not yet flushed"""
+    return query_many(kind, [entity_id], tier, since, until)[entity_id]
+
+
+def sla(kind, entity_id, since, until):
+    """Availability and volume totals over a range from the hourly tier"""
+    rows = query(kind, entity_id, "1h", since, until)
+    total = dict.fromkeys(_SUMMED, 0)
+    total.update(users_min=None, users_max=None)
+    for row in rows:
+        total = _merged(total, row)
+
+    samples = total["samples"]
+    return {
+        "buckets": len(rows),
+        "samples": samples,
+        "availability_pct": round(100 * total["up"] / samples, 3) if samples else None,
+        "avg_users": round(total["users_sum"] / samples, 1) if samples and kind == "app" else None,
+        "min_users": total["users_min"],
+        "max_users": total["users_max"],
+        "total_sum": total["total_sum"],
+        "failed_sum": total["failed_sum"],
+        "transactions": total["total_increase"],
+        "errors": total["failed_increase"],
+        "error_ratio": (
+            round(total["failed_increase"] / total["total_increase"], 4)
+            if total["total_increase"] else None
+        )
+    }
@@ -4,22 +4,49 @@ Background monitoring engine
 Runs independently of UI requests
 """
 
+import atexit
+import heapq
+import itertools
+import queue
+import random
 import threading
 import time
-import requests
 
-from models import (
-    db,
-    Application,
-    Interface,
-    InterfaceEndpoint
-)
+from collections import namedtuple
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from async_probe import AsyncProbeEngine
+import history
+import latency
+import metrics
+import rollups
+import topology
+from metrics import Counter, Gauge, Histogram
+from writer import WRITER
+from probe import check_url, fetch_number, normalize_url, result_key
+from models import db
 
 # =====================================================
 # CONFIG
 # =====================================================
 
-POLL_INTERVAL = 30   # seconds
+POLL_INTERVAL = 30       # seconds; default (fastest) interval per target
+MAX_POLL_INTERVAL = 300  # seconds; stable targets back off up to this
+MIN_POLL_INTERVAL = 5    # seconds; floor for per-row bounds
+BACKOFF_FACTOR = 1.5     # interval growth per unchanged, healthy probe
+JITTER = 0.1             # +/- fraction of the interval, spreads probes out
+TOPOLOGY_RELOAD = 5      # seconds between polls of the config change feed
+METRICS_RENDER = POLL_INTERVAL   # seconds between /metrics text rebuilds
+HISTORY_FLUSH = 60       # seconds between history / rollup flushes
+
+# "asyncio": one event loop holds every in-flight probe (large estates)
+# "thread":  ThreadPoolExecutor running the requests based helpers
+PROBE_BACKEND = "asyncio"
+
+PROBE_WORKERS = 32   # thread backend only: max probes in flight at once
+STORE_WORKERS = 4    # asyncio backend: threads storing finished probe results
+CYCLE_DEADLINE = 25  # seconds; probes not finished by then are dropped
 
 # In-memory cache (safe for intranet, single-node)
 MONITOR_CACHE = {
@@ -27,113 +54,1010 @@ MONITOR_CACHE = {
     "interfaces": {}
 }
 
+SUBSCRIBER_QUEUE_SIZE = 100   # events buffered per live dashboard
+
+# A counter dropping from above this fraction of 2**32 / 2**64
+# wrapped around; any other drop is a reset (service restart)
+COUNTER_WRAP_FRACTION = 0.75
+
+# Shared by both monitors, created in start_scheduler()
+PROBE_EXECUTOR = None
+ASYNC_ENGINE = None
+STORE_EXECUTOR = None
+
 
 # =====================================================
 # HELPERS
 # =====================================================
 
-def check_url(url):
-    try:
-        r = requests.get(
-            url,
-            timeout=5,
-            verify=False,
-            headers={"User-Agent": "Monitoring-Scheduler"}
-        )
-        return r.status_code < 400
-    except Exception:
-        return False
+PROBES = {
+    "check": check_url,
+    "number": fetch_number
+}
 
 
-def fetch_number(url):
-    try:
-        r = requests.get(url, timeout=5, verify=False)
-        return int(r.text.strip())
-    except Exception:
-        return 0
+def run_probes_threaded(jobs):
+    futures = {
+        PROBE_EXECUTOR.submit(PROBES[kind], url): key
+        for key, (kind, url) in jobs.items()
+    }
+
+    done, not_done = wait(futures, timeout=CYCLE_DEADLINE)
+
+    for f in not_done:
+        f.cancel()
+
+    return {futures[f]: f.result() for f in done}, len(not_done)
+
+
+def run_probes(jobs):
+    """
+    Fan out {key: (kind, url)} on the configured backend,
+    kind being "check" (check_url) or "number" (fetch_number).
+    Each distinct URL is probed once and its result handed to
+    every key that references it.
+    Returns {key: result} for every probe that finished
+    before CYCLE_DEADLINE; the rest are cancelled / ignored.
+    """
+    keys = {key: result_key(kind, url) for key, (kind, url) in jobs.items()}
+    unique = {keys[key]: job for key, job in jobs.items()}
+
+    if ASYNC_ENGINE:
+        results, dropped = ASYNC_ENGINE.run_probes(unique, CYCLE_DEADLINE)
+    elif PROBE_EXECUTOR:
+        results, dropped = run_probes_threaded(unique)
+    else:
+        # Scheduler not started (e.g. init scripts) - probe inline
+        results = {key: PROBES[kind](url) for key, (kind, url) in unique.items()}
+        dropped = 0
+
+    if dropped:
+        print(f"[Scheduler] {dropped} probes missed the cycle deadline")
+
+    return {
+        key: results[rkey]
+        for key, rkey in keys.items()
+        if rkey in results
+    }
+
+
+# =====================================================
+# ADAPTIVE POLLING
+# =====================================================
+
+# ("app" | "endpoint", id) -> {"interval", "next_due", "last"}
+TARGETS = {}
+
+
+def fastest_interval(row):
+    if row.min_poll_interval is None:
+        return POLL_INTERVAL
+    return max(row.min_poll_interval, MIN_POLL_INTERVAL)
+
+
+def slowest_interval(row):
+    fastest = fastest_interval(row)
+    if row.max_poll_interval is None:
+        return max(MAX_POLL_INTERVAL, fastest)
+    return max(row.max_poll_interval, fastest)
+
+
+def reschedule(target, row, ok, reading):
+    """
+    Failing targets and targets whose reading just changed go back
+    to their minimum interval; stable healthy ones back off towards
+    their maximum. row supplies the optional per-row bounds.
+    Returns the next due time (jittered).
+    """
+    state = TARGETS.get(target)
+
+    fastest = fastest_interval(row)
+    slowest = slowest_interval(row)
+
+    if state is None or not ok or reading != state["last"]:
+        interval = fastest
+    else:
+        interval = min(state["interval"] * BACKOFF_FACTOR, slowest)
+
+    next_due = time.time() + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    TARGETS[target] = {
+        "interval": interval,
+        "next_due": next_due,
+        "last": reading
+    }
+    return next_due
+
+
+# =====================================================
+# CHANGE EVENTS (pushed to dashboards over SSE)
+# =====================================================
+
+_SUBSCRIBERS = set()
+_SUBSCRIBERS_LOCK = threading.Lock()
+
+# Serialises read-modify-write of MONITOR_CACHE entries
+_STORE_LOCK = threading.Lock()
+
+
+def subscribe():
+    """Returns a queue receiving (kind, id, entry) for every state change"""
+    q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _SUBSCRIBERS_LOCK:
+        _SUBSCRIBERS.add(q)
+    return q
+
+
+def unsubscribe(q):
+    with _SUBSCRIBERS_LOCK:
+        _SUBSCRIBERS.discard(q)
+
+
+# Change on every probe (timings, jittered intervals and what is
+# derived from them); they ride along with the next real state change
+_VOLATILE = (
+    "last_checked", "latency", "elapsed",
+    "total_increase", "failed_increase",
+    "total_rate", "failed_rate", "error_ratio"
+)
+
+
+def _state(entry):
+    """Entry without its timestamps / timings, for change detection"""
+    if not isinstance(entry, dict):
+        return entry
+    return {k: _state(v) for k, v in entry.items() if k not in _VOLATILE}
+
+
+def publish_if_changed(kind, entity_id, old, new):
+    if old is not None and _state(old) == _state(new):
+        return
+
+    with _SUBSCRIBERS_LOCK:
+        subscribers = list(_SUBSCRIBERS)
+
+    for q in subscribers:
+        try:
+            q.put_nowait((kind, entity_id, new))
+        except queue.Full:
+            pass   # slow viewer, it resyncs from the snapshot on reconnect
+
+
+def record_reading(kind, entity_id, reading):
+    """Raw history block plus the 1m / 1h / 1d rollups"""
+    history.record(kind, entity_id, reading["last_checked"], reading)
+    rollups.record(kind, entity_id, reading["last_checked"], reading)
 
 
 # =====================================================
 # APPLICATION MONITOR
 # =====================================================
 
-def monitor_applications(app_context):
-    with app_context():
-        while True:
-            print("[Scheduler] Checking applications...")
+def application_jobs(app):
+    return {
+        (app.id, "healthy"): ("check", app.app_health_url),
+        (app.id, "active_users"): ("number", app.active_users_url)
+    }
+
 
-            for app in Application.query.filter_by(is_active=True).all():
-                health = check_url(app.app_health_url)
-                users = fetch_number(app.active_users_url)
+def store_application(app, results):
+    """app: Application row, topology AppNode or AppTarget"""
+    app_id = app.id
+    if (app_id, "healthy") not in results:
+        return
 
-                MONITOR_CACHE["applications"][app.id] = {
-                    "healthy": health,
-                    "active_users": users,
-                    "last_checked": time.time()
-                }
+    entry = {
+        "healthy": results[(app_id, "healthy")],
+        "active_users": results.get((app_id, "active_users"), 0),
+        "latency": latency.summary(normalize_url(app.app_health_url)),
+        "last_checked": time.time()
+    }
 
-            time.sleep(POLL_INTERVAL)
+    with _STORE_LOCK:
+        old = MONITOR_CACHE["applications"].get(app_id)
+        MONITOR_CACHE["applications"][app_id] = entry
+
+    record_reading("app", app_id, entry)
+    publish_if_changed("app", app_id, old, entry)
+
+
+def refresh_application(app):
+    """On-demand probe of one application (UI refresh)"""
+    store_application(app, run_probes(application_jobs(app)))
+    return MONITOR_CACHE["applications"].get(app.id)
 
 
 # =====================================================
 # INTERFACE MONITOR
 # =====================================================
 
-def monitor_interfaces(app_context):
-    with app_context():
+def endpoint_jobs(ep):
+    return {
+        (ep.id, "reachable"): ("check", ep.connectivity_url),
+        (ep.id, "total"): ("number", ep.transaction_count_url),
+        (ep.id, "failed"): ("number", ep.error_count_url)
+    }
+
+
+# (endpoint id, "total" / "failed") -> (timestamp, value) of the last reading
+_COUNTERS = {}
+
+
+def counter_delta(old, new):
+    """Increase of a cumulative counter, allowing for wraps and resets"""
+    if new >= old:
+        return new - old
+
+    for bits in (32, 64):
+        modulus = 1 << bits
+        if old < modulus:
+            if old >= modulus * COUNTER_WRAP_FRACTION:
+                return modulus - old + new
+            break
+
+    return new   # restarted from zero
+
+
+def counter_increase(key, ts, value):
+    """
+    (increase, seconds) since the previous reading of a counter, or
+    (None, None) without a usable baseline. Call under _STORE_LOCK.
+    """
+    previous = _COUNTERS.get(key)
+
+    if previous and value == 0 and previous[1] > 0:
+        return None, None     # fetch_number() reports failures as 0
+
+    _COUNTERS[key] = (ts, value)
+
+    if previous is None or ts <= previous[0]:
+        return None, None
+
+    return counter_delta(previous[1], value), ts - previous[0]
+
+
+def _rate(increase, seconds):
+    return round(increase / seconds, 4) if increase is not None else None
+
+
+def endpoint_reading(ep, results):
+    """
+    ep: InterfaceEndpoint row, EndpointNode or EndpointTarget.
+    Besides the raw counters carries their per-second rates and the
+    error ratio of the last interval. Call under _STORE_LOCK.
+    """
+    now = time.time()
+    total = results.get((ep.id, "total"), 0)
+    failed = results.get((ep.id, "failed"), 0)
+
+    total_inc, total_secs = counter_increase((ep.id, "total"), now, total)
+    failed_inc, failed_secs = counter_increase((ep.id, "failed"), now, failed)
+
+    return {
+        "reachable": results[(ep.id, "reachable")],
+        "total": total,
+        "failed": failed,
+        "total_increase": total_inc,
+        "failed_increase": failed_inc,
+        "elapsed": round(total_secs, 3) if total_secs else None,
+        "total_rate": _rate(total_inc, total_secs),
+        "failed_rate": _rate(failed_inc, failed_secs),
+        "error_ratio": (
+            round(failed_inc / total_inc, 4)
+            if total_inc and failed_inc is not None else None
+        ),
+        "latency": latency.summary(normalize_url(ep.connectivity_url)),
+        "last_checked": now
+    }
+
+
+def store_interface(interface_id, endpoints, results):
+    """
+    Rebuilds an interface entry from all its endpoints.
+    endpoints: InterfaceEndpoint rows / EndpointNodes / EndpointTargets
+    """
+    with _STORE_LOCK:
+        # Keep the previous reading for endpoints that missed the deadline
+        previous = MONITOR_CACHE["interfaces"].get(interface_id) or {}
+        result = {
+            "inbound": None,
+            "outbound": None,
+            "last_checked": time.time()
+        }
+
+        for ep in endpoints:
+            key = ep.direction.lower()
+            if key not in ("inbound", "outbound"):
+                continue
+
+            if (ep.id, "reachable") not in results:
+                result[key] = previous.get(key)
+                continue
+
+            result[key] = reading = endpoint_reading(ep, results)
+            record_reading("endpoint", ep.id, reading)
+
+        MONITOR_CACHE["interfaces"][interface_id] = result
+
+    publish_if_changed("interface", interface_id, previous or None, result)
+
+
+def store_endpoint(ep, results):
+    """Updates one direction of an interface entry, keeping the other"""
+    interface_id = ep.interface_id
+    key = ep.direction.lower()
+    if key not in ("inbound", "outbound") or (ep.id, "reachable") not in results:
+        return
+
+    with _STORE_LOCK:
+        previous = MONITOR_CACHE["interfaces"].get(interface_id)
+        result = dict(previous or {"inbound": None, "outbound": None})
+
+        result[key] = reading = endpoint_reading(ep, results)
+        result["last_checked"] = time.time()
+
+        MONITOR_CACHE["interfaces"][interface_id] = result
+
+    record_reading("endpoint", ep.id, reading)
+
+    publish_if_changed("interface", interface_id, previous, result)
+
+
+def refresh_interfaces(interfaces):
+    """
+    On-demand probe of loaded Interface rows / InterfaceNodes (UI refresh).
+    All their endpoints are probed as one batch.
+    """
+    jobs = {}
+    endpoints_by_interface = {}
+
+    for interface in interfaces:
+        endpoints = [ep for ep in interface.endpoints if ep.is_active]
+        endpoints_by_interface[interface.id] = endpoints
+
+        for ep in endpoints:
+            jobs.update(endpoint_jobs(ep))
+
+    results = run_probes(jobs)
+
+    for interface_id, endpoints in endpoints_by_interface.items():
+        store_interface(interface_id, endpoints, results)
+
+    return {
+        interface_id: MONITOR_CACHE["interfaces"].get(interface_id)
+        for interface_id in endpoints_by_interface
+    }
+
+
+# =====================================================
+# TARGET SCHEDULER
+# Min-heap of (next_due, seq, target); one dispatcher thread
+# hands each due target to the probe backend on its own.
+# =====================================================
+
+AppTarget = namedtuple("AppTarget", [
+    "id", "name", "environment",
+    "app_health_url", "active_users_url",
+    "min_poll_interval", "max_poll_interval"
+])
+
+EndpointTarget = namedtuple("EndpointTarget", [
+    "id", "interface_id", "direction",
+    "application", "environment", "target_system",
+    "connectivity_url", "transaction_count_url", "error_count_url",
+    "min_poll_interval", "max_poll_interval"
+])
+
+# Housekeeping entries sharing the heap with probe targets
+RELOAD = ("topology", 0)
+RENDER = ("metrics", 0)
+FLUSH = ("history", 0)
+COMPACT = ("compaction", 0)
+
+# target -> AppTarget / EndpointTarget of every active row
+SPECS = {}
+
+_HEAP = []
+_HEAP_COND = threading.Condition()
+_SEQ = itertools.count()
+
+# Targets with a live heap entry or a probe in flight -> sequence
+# number of their newest entry (IN_FLIGHT once dispatched); older
+# entries of a rescheduled target are skipped at the heap top
+_SCHEDULED = {}
+IN_FLIGHT = -1
+
+# target -> every target connected to it through shared probe URLs
+# (itself included); targets sharing nothing are not listed
+_SHARED = {}
+
+# topology.Topology SPECS was built from
+_LOADED = None
+
+
+def overdue_count():
+    now = time.time()
+    with _HEAP_COND:
+        return sum(
+            1 for due, seq, target in _HEAP
+            if due <= now and _SCHEDULED.get(target) == seq
+        )
+
+
+def probes_in_flight():
+    if ASYNC_ENGINE:
+        return len(ASYNC_ENGINE.in_flight)
+    return TARGETS_IN_FLIGHT.snapshot()
+
+
+# =====================================================
+# INSTRUMENTATION
+# =====================================================
+
+TARGET_DURATION = Histogram(
+    "scheduler_target_duration_seconds",
+    "Dispatch to completion time of one target's probes"
+)
+SCHEDULE_LAG = Histogram(
+    "scheduler_lag_seconds",
+    "Actual minus intended dispatch time per target"
+)
+RELOAD_DURATION = Histogram(
+    "scheduler_reload_duration_seconds",
+    "Time to rebuild scheduler targets from a new topology snapshot"
+)
+DISPATCHED = Counter(
+    "scheduler_dispatched_total",
+    "Targets handed to the probe backend"
+)
+OVERRUNS = Counter(
+    "scheduler_overruns_total",
+    "Targets whose probes took longer than their own interval"
+)
+DEADLINE_MISSES = Counter(
+    "scheduler_deadline_misses_total",
+    "Targets whose probes did not finish before CYCLE_DEADLINE"
+)
+TARGETS_IN_FLIGHT = Gauge(
+    "scheduler_targets_in_flight",
+    "Targets dispatched and not yet completed"
+)
+QUEUE_DEPTH = Gauge(
+    "scheduler_queue_depth",
+    "Targets past their due time still waiting for dispatch",
+    func=overdue_count
+)
+HEAP_SIZE = Gauge(
+    "scheduler_heap_size",
+    "Entries on the scheduler heap",
+    func=lambda: len(_HEAP)
+)
+PROBES_IN_FLIGHT = Gauge(
+    "scheduler_probes_in_flight",
+    "Probes currently running on the backend",
+    func=probes_in_flight
+)
+
+
+def push(target, due):
+    """Queues a target; supersedes any entry it already has"""
+    with _HEAP_COND:
+        seq = next(_SEQ)
+        heapq.heappush(_HEAP, (due, seq, target))
+        _SCHEDULED[target] = seq
+        _HEAP_COND.notify()
+
+
+def load_targets(topo, app_ids=None):
+    """
+    Active rows of a topology snapshot (or of some of its
+    applications) as plain, thread-safe specs
+    """
+    specs = {}
+
+    if app_ids is None:
+        apps = topo.active_apps()
+        interfaces = topo.active_interfaces()
+    else:
+        apps = [topo.apps[k] for k in app_ids if k in topo.apps]
+        interfaces = [i for a in apps for i in a.interfaces if i.is_active]
+        apps = [a for a in apps if a.is_active]
+
+    for app in apps:
+        specs[("app", app.id)] = AppTarget(
+            app.id, app.name, app.environment,
+            app.app_health_url, app.active_users_url,
+            app.min_poll_interval, app.max_poll_interval
+        )
+
+    for interface in interfaces:
+        application = topo.application_of(interface)
+
+        for ep in interface.endpoints:
+            if not ep.is_active:
+                continue
+
+            specs[("endpoint", ep.id)] = EndpointTarget(
+                ep.id, interface.id, ep.direction,
+                application.name, application.environment,
+                interface.target_system_name,
+                ep.connectivity_url, ep.transaction_count_url,
+                ep.error_count_url,
+                ep.min_poll_interval, ep.max_poll_interval
+            )
+
+    return specs
+
+
+def prune_cache(specs):
+    """Forgets readings of interfaces / directions no longer monitored"""
+    directions = {}
+    for target, spec in specs.items():
+        if target[0] == "endpoint":
+            directions.setdefault(spec.interface_id, set()).add(spec.direction.lower())
+
+    with _STORE_LOCK:
+        for interface_id in list(MONITOR_CACHE["interfaces"]):
+            if interface_id not in directions:
+                del MONITOR_CACHE["interfaces"][interface_id]
+                continue
+
+            entry = MONITOR_CACHE["interfaces"][interface_id]
+            for key in ("inbound", "outbound"):
+                if entry.get(key) and key not in directions[interface_id]:
+                    entry = dict(entry, **{key: None})
+
+            MONITOR_CACHE["interfaces"][interface_id] = entry
+
+        for key in list(_COUNTERS):
+            if ("endpoint", key[0]) not in specs:
+                del _COUNTERS[key]
+
+
+def app_targets(topo, app_id):
+    """Every target of an application, active or not"""
+    app = topo.apps.get(app_id)
+    if app is None:
+        return set()
+
+    return {("app", app.id)} | {
+        ("endpoint", ep.id)
+        for interface in app.interfaces
+        for ep in interface.endpoints
+    }
+
+
+def same_probes(target, a, b):
+    """True if two specs probe the same URLs within the same bounds"""
+    return (
+        target_jobs(target, a) == target_jobs(target, b)
+        and a.min_poll_interval == b.min_poll_interval
+        and a.max_poll_interval == b.max_poll_interval
+    )
+
+
+def share_groups(specs):
+    """
+    Groups targets probing a common URL (e.g. one gateway health
+    check behind many interfaces), transitively, so the scheduler can
+    dispatch them together and probe each shared URL once.
+    """
+    parent = {}
+    owner = {}     # result_key -> first target probing it
+
+    def root(target):
+        while parent.get(target, target) != target:
+            target = parent[target]
+        return target
+
+    for target, spec in specs.items():
+        for kind, url in target_jobs(target, spec).values():
+            first = owner.setdefault(result_key(kind, url), target)
+            a, b = root(first), root(target)
+            if a != b:
+                parent[b] = a
+
+    groups = {}
+    for target in parent:
+        groups.setdefault(root(target), []).append(target)
+
+    return {
+        target: (group_root, *members)
+        for group_root, members in groups.items()
+        for target in (group_root, *members)
+    }
+
+
+def reload_targets():
+    """
+    Catches up with the config change feed. Only the targets of
+    applications named in new changes are added, removed or
+    rescheduled; the first call (or one that fell behind the feed's
+    in-memory log) rebuilds everything, as does the one after a
+    failed reload. New and changed targets start at a random point of
+    their first interval so they do not fire in a burst; removed ones
+    are dropped lazily at the heap top.
+    """
+    global _LOADED
+
+    try:
+        topo = topology.sync()
+    finally:
+        db.session.remove()
+
+    if _LOADED is not None and topo.version == _LOADED.version:
+        return
+
+    changes = topology.changes_since(_LOADED.version) if _LOADED else None
+    started = time.time()
+    loaded, _LOADED = _LOADED, None   # half applied: rebuild next time
+
+    if changes is None:
+        specs = load_targets(topo)
+        affected = set(SPECS) | set(specs)
+    else:
+        app_ids = {c.app_id for c in changes}
+        specs = load_targets(topo, app_ids)
+        affected = set(specs)
+        for app_id in app_ids:
+            affected |= app_targets(loaded, app_id) | app_targets(topo, app_id)
+
+    now = time.time()
+    added = changed = removed = 0
+
+    for target in affected:
+        spec = specs.get(target)
+        old = SPECS.get(target)
+
+        if spec is None:
+            if old is not None:
+                del SPECS[target]
+                TARGETS.pop(target, None)
+                removed += 1
+            continue
+
+        if target in _SCHEDULED:
+            if spec == old:
+                continue
+
+            SPECS[target] = spec
+            if old is None:
+                continue   # re-activated while its last probe is in flight
+
+            if same_probes(target, old, spec):
+                changed += 1   # labels only (names, environment)
+                continue
+
+        # New URLs / bounds, or lost by a failed reload: probe soon and
+        # adapt from the fastest interval
+        SPECS[target] = spec
+        TARGETS.pop(target, None)
+        push(target, now + random.uniform(0, fastest_interval(spec)))
+        if old is None:
+            added += 1
+        else:
+            changed += 1
+
+    if changes is None or added or changed or removed:
+        prune_cache(SPECS)
+        _SHARED.clear()
+        _SHARED.update(share_groups(SPECS))
+
+    _LOADED = topo
+    RELOAD_DURATION.observe(time.time() - started)
+
+    if added or changed or removed:
+        print(
+            f"[Scheduler] Topology v{topo.version}: {added} added, "
+            f"{changed} changed, {removed} removed, {len(SPECS)} total"
+        )
+
+
+def next_due_target():
+    """Blocks until the heap top is due, then pops (target, due)"""
+    with _HEAP_COND:
         while True:
-            print("[Scheduler] Checking interfaces...")
+            now = time.time()
+
+            if _HEAP and _HEAP[0][0] <= now:
+                due, seq, target = heapq.heappop(_HEAP)
+                if _SCHEDULED.get(target) == seq:
+                    return target, due
+                continue   # superseded by a later push
+
+            timeout = _HEAP[0][0] - now if _HEAP else None
+            _HEAP_COND.wait(timeout)
+
+
+def claim_group(target):
+    """
+    The popped target plus every target sharing a probe URL with it
+    that is waiting on the heap. Their entries are superseded, so a
+    group fires at its earliest due member and each shared URL is
+    probed once (the engines single-flight concurrent probes).
+    """
+    with _HEAP_COND:
+        claimed = [target]
+        _SCHEDULED[target] = IN_FLIGHT
+
+        for member in _SHARED.get(target, ()):
+            if member == target or member not in SPECS:
+                continue
+            if _SCHEDULED.get(member, IN_FLIGHT) == IN_FLIGHT:
+                continue   # already in flight (or never queued)
+
+            _SCHEDULED[member] = IN_FLIGHT
+            claimed.append(member)
+
+        return claimed
+
+
+def target_jobs(target, spec):
+    if target[0] == "app":
+        return application_jobs(spec)
+    return endpoint_jobs(spec)
+
+
+def complete(target, spec, results, started):
+    """
+    Stores a target's readings and puts it back on the heap; the
+    target is rescheduled even if storing them fails
+    """
+    TARGETS_IN_FLIGHT.dec()
+    next_due = None
+
+    try:
+        duration = time.time() - started
+        interval = TARGETS.get(target, {}).get("interval") or fastest_interval(spec)
+
+        TARGET_DURATION.observe(duration)
+        if duration > interval:
+            OVERRUNS.inc()
+
+        if target[0] == "app":
+            store_application(spec, results)
+            key = (spec.id, "healthy")
+            ok = reading = results.get(key)
+        else:
+            store_endpoint(spec, results)
+            key = (spec.id, "reachable")
+            ok = results.get(key)
+            reading = (ok, results.get((spec.id, "failed"), 0))
+
+        if key not in results:
+            # Missed the deadline: try again after the shortest interval
+            DEADLINE_MISSES.inc()
+        else:
+            next_due = reschedule(target, spec, ok, reading)
+
+    except Exception as e:
+        print(f"[Scheduler] Storing results failed for {target}: {e}")
+
+    finally:
+        push(target, next_due or time.time() + fastest_interval(spec))
+
+
+def probe_and_complete(target, spec, jobs, started):
+    """Thread backend: runs a target's probes on a pool thread"""
+    results = {}
+    try:
+        results = {
+            key: PROBES[kind](url) for key, (kind, url) in jobs.items()
+        }
+    except Exception as e:
+        print(f"[Scheduler] Probe batch failed for {target}: {e}")
+    finally:
+        complete(target, spec, results, started)
+
+
+def dispatch(target, spec):
+    """Hands a target to the backend; on failure it is requeued"""
+    started = time.time()
+
+    DISPATCHED.inc()
+    TARGETS_IN_FLIGHT.inc()
+
+    try:
+        _submit(target, spec, target_jobs(target, spec), started)
+    except Exception as e:
+        print(f"[Scheduler] Dispatch failed for {target}: {e}")
+        TARGETS_IN_FLIGHT.dec()
+        push(target, time.time() + fastest_interval(spec))
+
+
+def _submit(target, spec, jobs, started):
+    if ASYNC_ENGINE:
+        def done(future):
+            error = future.exception()
+            if error:
+                print(f"[Scheduler] Probe batch failed for {target}: {error}")
+            results = {} if error else future.result()[0]
 
-            for interface in Interface.query.filter_by(is_active=True).all():
-                result = {
-                    "inbound": None,
-                    "outbound": None
-                }
+            # Off the event loop: storing encodes history, updates
+            # rollups and fans out SSE events
+            try:
+                STORE_EXECUTOR.submit(complete, target, spec, results, started)
+            except RuntimeError:
+                pass   # interpreter exiting, the pool is already shut down
 
-                endpoints = InterfaceEndpoint.query.filter_by(
-                    interface_id=interface.id,
-                    is_active=True
-                ).all()
+        ASYNC_ENGINE.submit(jobs, CYCLE_DEADLINE).add_done_callback(done)
+    else:
+        PROBE_EXECUTOR.submit(probe_and_complete, target, spec, jobs, started)
 
-                for ep in endpoints:
-                    data = {
-                        "reachable": check_url(ep.connectivity_url),
-                        "total": fetch_number(ep.transaction_count_url),
-                        "failed": fetch_number(ep.error_count_url),
-                        "last_checked": time.time()
-                    }
 
-                    if ep.direction == "INBOUND":
-                        result["inbound"] = data
-                    elif ep.direction == "OUTBOUND":
-                        result["outbound"] = data
+def render_metrics():
+    """
+    Latest readings of every monitored target as Prometheus series,
+    published together with the internal metrics as one text blob.
+    """
+    apps = [
+        (spec, MONITOR_CACHE["applications"].get(spec.id))
+        for target, spec in SPECS.items() if target[0] == "app"
+    ]
+    endpoints = []
+
+    for target, spec in SPECS.items():
+        if target[0] != "endpoint":
+            continue
+        entry = MONITOR_CACHE["interfaces"].get(spec.interface_id) or {}
+        endpoints.append((spec, entry.get(spec.direction.lower())))
+
+    # Ids keep series unique when names / target systems repeat
+    def app_series(field):
+        return [
+            ({
+                "app_id": s.id,
+                "application": s.name,
+                "environment": s.environment
+            }, int(e[field]))
+            for s, e in apps if e
+        ]
+
+    def endpoint_series(field, value=int):
+        return [
+            ({
+                "endpoint_id": s.id,
+                "interface_id": s.interface_id,
+                "application": s.application,
+                "environment": s.environment,
+                "target_system": s.target_system,
+                "direction": s.direction
+            }, value(e[field]))
+            for s, e in endpoints if e and e.get(field) is not None
+        ]
 
-                MONITOR_CACHE["interfaces"][interface.id] = result
+    lines = (
+        metrics.family("monitor_app_healthy",
+                       "1 if the application health URL answered < 400",
+                       "gauge", app_series("healthy"))
+        + metrics.family("monitor_app_active_users",
+                         "Active users reported by the application",
+                         "gauge", app_series("active_users"))
+        + metrics.family("monitor_interface_reachable",
+                         "1 if the interface connectivity URL answered < 400",
+                         "gauge", endpoint_series("reachable"))
+        + metrics.family("monitor_interface_total",
+                         "Transaction counter reported by the interface",
+                         "gauge", endpoint_series("total"))
+        + metrics.family("monitor_interface_failed",
+                         "Error counter reported by the interface",
+                         "gauge", endpoint_series("failed"))
+        + metrics.family("monitor_interface_throughput",
+                         "Transactions per second over the last poll interval",
+                         "gauge", endpoint_series("total_rate", float))
+        + metrics.family("monitor_interface_error_rate",
+                         "Errors per second over the last poll interval",
+                         "gauge", endpoint_series("failed_rate", float))
+        + metrics.family("monitor_interface_error_ratio",
+                         "Errors / transactions over the last poll interval",
+                         "gauge", endpoint_series("error_ratio", float))
+    )
 
-            time.sleep(POLL_INTERVAL)
+    return metrics.publish(lines)
+
+
+def flush_history():
+    history.flush()
+    rollups.flush()
+
+
+def run_housekeeping(entry, task, every):
+    """
+    Runs one housekeeping task. It is requeued even if it fails: the
+    dispatcher thread is the only scheduler there is, so an escaping
+    exception would stop all monitoring.
+    """
+    try:
+        task()
+    except Exception as e:
+        print(f"[Scheduler] {entry[0].capitalize()} task failed: {e}")
+        db.session.remove()   # drop a session the failure left half-used
+    finally:
+        push(entry, time.time() + every)
+
+
+def run_dispatcher(app_context):
+    with app_context():
+        try:
+            history.resume()
+        except Exception as e:
+            print(f"[Scheduler] Could not resume history blocks: {e}")
+            db.session.remove()
+
+        # Housekeeping entry -> (task, seconds between runs)
+        housekeeping = {
+            RELOAD: (reload_targets, TOPOLOGY_RELOAD),
+            RENDER: (render_metrics, METRICS_RENDER),
+            FLUSH: (flush_history, HISTORY_FLUSH),
+            COMPACT: (rollups.compact, rollups.COMPACT_EVERY)
+        }
+
+        push(RELOAD, time.time())
+        push(RENDER, time.time())
+        push(FLUSH, time.time() + HISTORY_FLUSH)
+        push(COMPACT, time.time() + rollups.COMPACT_EVERY)
+
+        while True:
+            target, due = next_due_target()
+
+            if target in housekeeping:
+                run_housekeeping(target, *housekeeping[target])
+                continue
+
+            spec = SPECS.get(target)
+            if spec is None:
+                _SCHEDULED.pop(target, None)   # row deleted / deactivated
+                continue
+
+            SCHEDULE_LAG.observe(max(0, time.time() - due))
+            for member in claim_group(target):
+                dispatch(member, SPECS[member])
 
 
 # =====================================================
 # START SCHEDULER
 # =====================================================
 
+_STARTED = False
+_START_LOCK = threading.Lock()
+
+
 def start_scheduler(app):
     """
-    Call this once from app.py
+    Starts the monitors for this process; later calls do nothing
     """
 
-    print("[Scheduler] Starting background monitors...")
+    global PROBE_EXECUTOR, ASYNC_ENGINE, STORE_EXECUTOR, _STARTED
+
+    with _START_LOCK:
+        if _STARTED:
+            return
+        _STARTED = True
+
+    print(f"[Scheduler] Starting background monitors ({PROBE_BACKEND})...")
 
     app_context = app.app_context
 
-    threading.Thread(
-        target=monitor_applications,
-        args=(app_context,),
-        daemon=True
-    ).start()
+    # Exit hooks run last-in first-out: queue history, then drain the writer
+    WRITER.start(app)
+    atexit.register(history.flush)
+    atexit.register(rollups.flush)
+
+    if PROBE_BACKEND == "asyncio":
+        STORE_EXECUTOR = ThreadPoolExecutor(
+            max_workers=STORE_WORKERS,
+            thread_name_prefix="store"
+        )
+        ASYNC_ENGINE = AsyncProbeEngine()
+    else:
+        PROBE_EXECUTOR = ThreadPoolExecutor(
+            max_workers=PROBE_WORKERS,
+            thread_name_prefix="probe"
+        )
 
     threading.Thread(
-        target=monitor_interfaces,
+        target=run_dispatcher,
         args=(app_context,),
+        name="scheduler",
         daemon=True
     ).start()
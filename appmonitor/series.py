@@ -0,0 +1,177 @@
+"""
+series.py
+Chart-ready time series of one target field
+Reads raw history or the coarsest-fitting rollup tier, then
+downsamples to the requested point count with LTTB
+(Largest-Triangle-Three-Buckets), which keeps peaks and dips.
+"""
+
+import time
+
+import history
+import rollups
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+RAW_RESOLUTION = 30      # seconds between raw samples (fastest poll)
+RAW_MAX_SPAN = 6 * 3600  # longer ranges read rollups, never raw blocks
+MAX_SOURCE_POINTS = 4000 # read a coarser source beyond this many points
+DEFAULT_POINTS = 200
+MAX_POINTS = 2000
+
+# Plottable fields per target kind (first one is the default)
+FIELDS = {
+    "app": ("active_users", "healthy"),
+    "endpoint": (
+        "total_rate", "failed_rate", "error_ratio",
+        "total", "failed", "reachable"
+    )
+}
+
+# Derived from counter increases: field -> (numerator, denominator)
+RATES = {
+    "total_rate": ("total_increase", "elapsed"),
+    "failed_rate": ("failed_increase", "elapsed"),
+    "error_ratio": ("failed_increase", "total_increase")
+}
+
+
+# =====================================================
+# LTTB
+# =====================================================
+
+def lttb(points, threshold):
+    """
+    points: [(x, y), ...] sorted by x. Returns at most threshold of
+    them, always keeping the first and last.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle corner
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in span) / len(span)
+        avg_y = sum(p[1] for p in span) / len(span)
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+
+        best, best_area = start, -1
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+# =====================================================
+# SOURCES
+# =====================================================
+
+def _bucket_value(row, field):
+    """Per-bucket value of a field: availability ratio, rate or average"""
+    samples = row["samples"]
+    if not samples:
+        return None
+
+    if field in rollups.UP_FIELD.values():
+        return row["up"] / samples
+
+    if field in RATES:
+        num, den = RATES[field]
+        return row[num] / row[den] if row[num] is not None and row[den] else None
+
+    column = {
+        "active_users": "users_sum",
+        "total": "total_sum",
+        "failed": "failed_sum"
+    }[field]
+    return row[column] / samples
+
+
+def pick_source(since, until):
+    """"raw" or the finest rollup tier giving <= MAX_SOURCE_POINTS"""
+    now = time.time()
+    span = until - since
+
+    if (span <= RAW_MAX_SPAN
+            and span / RAW_RESOLUTION <= MAX_SOURCE_POINTS
+            and since >= now - rollups.RAW_RETENTION):
+        return "raw"
+
+    for tier, (bucket, retention) in rollups.TIERS.items():
+        if span / bucket <= MAX_SOURCE_POINTS and since >= now - retention:
+            return tier
+
+    return "1d"
+
+
+def _raw_points(kind, entity_id, field, since, until):
+    samples = history.query(kind, entity_id, since, until)
+
+    if field not in RATES:
+        return [(ts, float(r[field])) for ts, r in samples if field in r]
+
+    # Samples without a counter baseline (None increase) are skipped
+    num, den = RATES[field]
+    data = []
+    prev_ts = None
+    for ts, r in samples:
+        if "elapsed" not in r:
+            # Blocks written before elapsed was stored: the sample gap
+            r = dict(r, elapsed=ts - prev_ts if prev_ts else 0)
+        prev_ts = ts
+        if r.get(num) is not None and r.get(den):
+            data.append((ts, r[num] / r[den]))
+    return data
+
+
+def series_many(kind, entity_ids, field, since, until, points=DEFAULT_POINTS):
+    """
+    Returns (source, {entity_id: [[timestamp, value], ...]}); rollup
+    sources are read for all targets in one query
+    """
+    source = pick_source(since, until)
+
+    if source == "raw":
+        data = {
+            entity_id: _raw_points(kind, entity_id, field, since, until)
+            for entity_id in entity_ids
+        }
+    else:
+        data = {}
+        buckets = rollups.query_many(kind, entity_ids, source, since, until)
+        for entity_id, rows in buckets.items():
+            data[entity_id] = []
+            for row in rows:
+                value = _bucket_value(row, field)
+                if value is not None:
+                    data[entity_id].append((row["start"], value))
+
+    return source, {
+        entity_id: [[ts, round(v, 4)] for ts, v in lttb(samples, points)]
+        for entity_id, samples in data.items()
+    }
+
+
+def series(kind, entity_id, field, since, until, points=DEFAULT_POINTS):
+    """Returns (source, [[timestamp, value], ...])"""
+    source, data = series_many(kind, [entity_id], field, since, until, points)
+    return source, data[entity_id]
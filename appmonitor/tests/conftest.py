@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules import each other flat (import history, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Bare Flask app on a throwaway SQLite file (app.py starts threads)"""
+    from flask import Flask
+    from models import db, enable_sqlite_pragmas
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'monitor.db'}"
+    db.init_app(app)
+
+    with app.app_context():
+        enable_sqlite_pragmas(db.engine)
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def clean_topology(app):
+    """No snapshot and an empty change log before and after the test"""
+    import topology
+
+    def reset():
+        topology._SNAPSHOT = None
+        topology._CHANGES.clear()
+        topology._LOG_FLOOR = 0
+
+    reset()
+    yield
+    reset()
+
+
+@pytest.fixture
+def add_app(clean_topology):
+    """Commits an application with one interface and its endpoints"""
+    import topology
+    from models import db, Application, Interface, InterfaceEndpoint
+
+    def add(name, endpoints=1):
+        application = Application(
+            name=name, environment="PROD",
+            app_health_url=f"http://{name}.test/health",
+            active_users_url=f"http://{name}.test/users"
+        )
+        db.session.add(application)
+        db.session.flush()
+
+        interface = Interface(
+            source_app_id=application.id, target_system_name="SAP", direction="BOTH"
+        )
+        db.session.add(interface)
+        db.session.flush()
+
+        for i in range(endpoints):
+            db.session.add(InterfaceEndpoint(
+                interface_id=interface.id,
+                direction="INBOUND" if i % 2 == 0 else "OUTBOUND",
+                connectivity_url=f"http://{name}.test/ep{i}",
+                transaction_count_url=f"http://{name}.test/ep{i}/total",
+                error_count_url=f"http://{name}.test/ep{i}/failed"
+            ))
+
+        topology.record_change("app", application)
+        db.session.commit()
+        return application
+
+    return add
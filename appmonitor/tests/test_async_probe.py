@@ -0,0 +1,28 @@
+import pytest
+
+import async_probe
+from async_probe import proxied
+
+
+@pytest.fixture(autouse=True)
+def proxy_env(monkeypatch):
+    for name in ("http_proxy", "https_proxy", "all_proxy", "no_proxy"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+
+    async_probe._PROXIED.clear()
+    yield monkeypatch
+    async_probe._PROXIED.clear()
+
+
+def test_direct_without_a_proxy():
+    assert not proxied("http://sap.intranet.test/health")
+
+
+def test_proxied_hosts_follow_the_environment(proxy_env):
+    proxy_env.setenv("HTTP_PROXY", "http://proxy.test:3128")
+    proxy_env.setenv("NO_PROXY", "local.test")
+
+    assert proxied("http://sap.intranet.test/health")
+    assert not proxied("http://local.test/health")
+    assert not proxied("https://sap.intranet.test/health")   # no HTTPS_PROXY
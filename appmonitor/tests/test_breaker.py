@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+import async_probe
+from probe import BREAKER, CircuitBreaker, host_key
+
+HOST = "http://example.test:80"
+
+
+def _open(breaker, host=HOST):
+    for _ in range(breaker.threshold):
+        breaker.record_failure(host)
+
+
+def _expire(breaker, host=HOST):
+    breaker._hosts[host]["open_until"] = time.monotonic() - 1
+
+
+def test_stays_closed_below_the_threshold():
+    breaker = CircuitBreaker(threshold=3)
+    breaker.record_failure(HOST)
+    breaker.record_failure(HOST)
+
+    assert breaker.allow(HOST)
+    assert breaker.open_hosts() == []
+
+
+def test_opens_after_threshold_failures():
+    breaker = CircuitBreaker(threshold=3)
+    _open(breaker)
+
+    assert not breaker.allow(HOST)
+    assert breaker.open_hosts() == [HOST]
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=3)
+    breaker.record_failure(HOST)
+    breaker.record_failure(HOST)
+    breaker.record_success(HOST)
+    breaker.record_failure(HOST)
+
+    assert breaker.allow(HOST)
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = CircuitBreaker(threshold=3)
+    _open(breaker)
+    _expire(breaker)
+
+    assert breaker.allow(HOST)          # the trial
+    assert not breaker.allow(HOST)      # everyone else waits for it
+
+
+def test_successful_trial_closes_the_circuit():
+    breaker = CircuitBreaker(threshold=3)
+    _open(breaker)
+    _expire(breaker)
+    breaker.allow(HOST)
+
+    breaker.record_success(HOST)
+
+    assert breaker.allow(HOST)
+    assert breaker.open_hosts() == []
+
+
+def test_failed_trial_reopens_with_doubled_backoff():
+    breaker = CircuitBreaker(threshold=3, backoff=30, max_backoff=100)
+    _open(breaker)
+
+    for expected in (60, 100, 100):
+        _expire(breaker)
+        assert breaker.allow(HOST)
+        breaker.record_failure(HOST)
+
+        assert not breaker.allow(HOST)
+        assert breaker._hosts[HOST]["backoff"] == expected
+
+
+def test_host_key_matches_the_pool_key():
+    assert host_key("http://Example.test/a") == "http://example.test:80"
+    assert host_key("http://example.test:80/b") == "http://example.test:80"
+    assert host_key("https://user:pw@example.test/") == "https://example.test:443"
+    assert host_key("https://example.test:8443/") == "https://example.test:8443"
+
+
+@pytest.fixture
+def server():
+    """Keep-alive HTTP server on a free local port"""
+    loop = asyncio.new_event_loop()
+
+    async def handle(reader, writer):
+        while await async_probe._read_headers(reader):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+            await writer.drain()
+        writer.close()
+
+    srv = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0))
+    port = srv.sockets[0].getsockname()[1]
+
+    yield loop, port
+
+    for idle in async_probe._IDLE_CONNECTIONS.values():
+        for _, writer, _ in idle:
+            writer.close()
+    async_probe._IDLE_CONNECTIONS.clear()
+
+    srv.close()
+    loop.run_until_complete(asyncio.sleep(0.05))   # let handlers see EOF
+    loop.close()
+
+
+def test_trial_over_a_pooled_connection_closes_the_circuit(server):
+    loop, port = server
+    url = f"http://127.0.0.1:{port}/a"
+    host = host_key(url)
+
+    # Warm the keep-alive pool, then open the circuit for the host
+    assert loop.run_until_complete(async_probe.http_get(url)) == (200, b"ok")
+    assert async_probe._IDLE_CONNECTIONS
+
+    _open(BREAKER, host)
+    _expire(BREAKER, host)
+
+    try:
+        assert loop.run_until_complete(async_probe.http_get(url)) == (200, b"ok")
+        assert BREAKER.allow(host)
+        assert host not in BREAKER.open_hosts()
+    finally:
+        BREAKER.record_success(host)
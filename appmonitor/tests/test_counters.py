@@ -0,0 +1,60 @@
+import pytest
+
+import scheduler
+from scheduler import counter_delta, counter_increase
+
+
+@pytest.fixture(autouse=True)
+def clean_counters():
+    scheduler._COUNTERS.clear()
+    yield
+    scheduler._COUNTERS.clear()
+
+
+def test_delta_of_a_growing_counter():
+    assert counter_delta(100, 150) == 50
+    assert counter_delta(7, 7) == 0
+
+
+def test_delta_across_a_32_bit_wrap():
+    assert counter_delta(2 ** 32 - 10, 5) == 15
+
+
+def test_delta_across_a_64_bit_wrap():
+    assert counter_delta(2 ** 64 - 1, 3) == 4
+
+
+def test_drop_from_a_low_value_is_a_reset():
+    # Far from the 32-bit limit: the source restarted from zero
+    assert counter_delta(1000, 40) == 40
+    assert counter_delta(2 ** 33, 12) == 12
+
+
+def test_first_reading_has_no_baseline():
+    assert counter_increase((1, "total"), 100.0, 50) == (None, None)
+
+
+def test_increase_and_elapsed_since_the_previous_reading():
+    counter_increase((1, "total"), 100.0, 50)
+    assert counter_increase((1, "total"), 130.0, 80) == (30, 30.0)
+
+
+def test_zero_after_a_non_zero_value_is_skipped():
+    counter_increase((1, "total"), 100.0, 50)
+
+    # fetch_number() reports failures as 0: keep the old baseline
+    assert counter_increase((1, "total"), 130.0, 0) == (None, None)
+    assert counter_increase((1, "total"), 160.0, 110) == (60, 60.0)
+
+
+def test_reading_not_after_the_baseline_has_no_increase():
+    counter_increase((1, "total"), 100.0, 50)
+    assert counter_increase((1, "total"), 100.0, 60) == (None, None)
+
+
+def test_counters_are_kept_per_key():
+    counter_increase((1, "total"), 100.0, 50)
+    counter_increase((2, "total"), 100.0, 5)
+
+    assert counter_increase((1, "total"), 110.0, 55) == (5, 10.0)
+    assert counter_increase((2, "total"), 110.0, 25) == (20, 10.0)
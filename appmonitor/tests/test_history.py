@@ -0,0 +1,124 @@
+import math
+
+import history
+from history import BitReader, BitWriter, Block, FIELDS, decode
+
+
+def _round_trip(kind, readings, start=0):
+    block = Block(kind, 1, start, FIELDS[kind])
+    for ts, reading in readings:
+        block.append(ts, reading)
+
+    row = block.row()
+    return decode(row["fields"], row["start"], row["count"], row["data"])
+
+
+def test_bits_round_trip():
+    w = BitWriter()
+    values = [(1, 1), (0, 1), (5, 3), (2 ** 40 + 7, 41), (0, 7), (255, 8)]
+    for value, bits in values:
+        w.write(value, bits)
+
+    r = BitReader(w.to_bytes())
+    assert [r.read(bits) for _, bits in values] == [v for v, _ in values]
+
+
+def test_app_block_round_trip():
+    readings = [
+        (30, {"healthy": 1, "active_users": 120}),
+        (60, {"healthy": 1, "active_users": 125}),
+        (95, {"healthy": 0, "active_users": 0}),
+        (300, {"healthy": 1, "active_users": 4000}),
+    ]
+    assert _round_trip("app", readings) == readings
+
+
+def test_endpoint_block_keeps_missing_increases():
+    readings = [
+        (30, {"reachable": 1, "total": 10, "failed": 0,
+              "total_increase": None, "failed_increase": None, "elapsed": 0.0}),
+        (60, {"reachable": 1, "total": 40, "failed": 1,
+              "total_increase": 30, "failed_increase": 1, "elapsed": 30.25}),
+        (90, {"reachable": 0, "total": 40, "failed": 1,
+              "total_increase": 0, "failed_increase": 0, "elapsed": 29.75}),
+    ]
+    assert _round_trip("endpoint", readings) == readings
+
+
+def test_extreme_values_are_clamped_not_corrupted():
+    readings = [
+        (0, {"healthy": 1, "active_users": 0}),
+        (1, {"healthy": 1, "active_users": 2 ** 70}),
+        (2, {"healthy": 1, "active_users": -(2 ** 70)}),
+        (3, {"healthy": 1, "active_users": 7}),
+    ]
+    users = [r["active_users"] for _, r in _round_trip("app", readings)]
+    assert users == [0, history.INT_MAX, history.INT_MIN, 7]
+
+
+def test_float_column_round_trip():
+    fields = (("v", "float"),)
+    values = [0.0, 1.5, 1.5, -3.25, 1e-9, 12345.678, math.pi]
+
+    block = Block("test", 1, 0, fields)
+    for i, v in enumerate(values):
+        block.append(i, {"v": v})
+
+    assert [r["v"] for _, r in block.samples()] == values
+
+
+def test_timestamps_never_go_back():
+    readings = [(100, {"healthy": 1}), (90, {"healthy": 1}), (130, {"healthy": 1})]
+    stamps = [ts for ts, _ in _round_trip("app", readings)]
+    assert stamps == [100, 100, 130]
+
+
+def test_old_int_field_specs_still_decode():
+    fields = (("reachable", "int"), ("total_increase", "int"))
+    block = Block("endpoint", 1, 0, fields)
+    block.append(5, {"reachable": 1, "total_increase": 3})
+
+    row = block.row()
+    assert row["fields"] == "reachable:int,total_increase:int"
+    assert decode(row["fields"], 0, 1, row["data"]) == [
+        (5, {"reachable": 1, "total_increase": 3})
+    ]
+
+
+def test_elapsed_is_stored_against_the_timestamp_gap():
+    readings = [
+        (30, {"reachable": 1, "total": 10, "failed": 0,
+              "total_increase": None, "failed_increase": None, "elapsed": None}),
+        (61, {"reachable": 1, "total": 40, "failed": 0,
+              "total_increase": 30, "failed_increase": 0, "elapsed": 30.517}),
+        # Baseline from two samples back (a skipped counter read)
+        (90, {"reachable": 1, "total": 90, "failed": 0,
+              "total_increase": 50, "failed_increase": 0, "elapsed": 59.482}),
+    ]
+    assert _round_trip("endpoint", readings) == readings
+
+
+def _jittered_block(codec):
+    block = Block("endpoint", 1, 0, (("elapsed", codec),))
+    now = 0.0
+    for i in range(120):
+        gap = 30 + (i * 7919 % 6000 - 3000) / 1000    # +/- 3 s of jitter
+        now += gap
+        block.append(now, {"elapsed": gap})
+    return len(block.row()["data"])
+
+
+def test_jittered_elapsed_stays_compact():
+    assert _jittered_block("gap") * 8 / 120 <= 32     # timestamps included
+    assert _jittered_block("gap") * 2 < _jittered_block("float")
+
+
+def test_old_float_elapsed_blocks_still_decode():
+    fields = (("reachable", "int"), ("elapsed", "float"))
+    block = Block("endpoint", 1, 0, fields)
+    block.append(30, {"reachable": 1, "elapsed": 30.25})
+
+    row = block.row()
+    assert decode(row["fields"], 0, 1, row["data"]) == [
+        (30, {"reachable": 1, "elapsed": 30.25})
+    ]
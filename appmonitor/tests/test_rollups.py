@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+import rollups
+from models import db, HistoryBlock, HistoryRollup
+from rollups import DAY, UPSERT_ROLLUP
+from writer import WriteBehind
+
+HOUR = 3600
+
+
+@pytest.fixture
+def wb(app, monkeypatch):
+    w = WriteBehind(flush_ms=20)
+    w.start(app)
+    monkeypatch.setattr(rollups, "WRITER", w)
+
+    rollups._OPEN.clear()
+    rollups._SEALED.clear()
+    yield w
+    w.stop()
+    rollups._OPEN.clear()
+    rollups._SEALED.clear()
+
+
+def _delta(**values):
+    row = {
+        "kind": "app", "entity_id": 1, "tier": "1h", "start": 0,
+        "samples": 0, "up": 0,
+        "users_min": None, "users_max": None, "users_sum": 0,
+        "total_sum": 0, "failed_sum": 0,
+        "total_increase": 0, "failed_increase": 0, "elapsed": 0.0
+    }
+    row.update(values)
+    return row
+
+
+def _stored(tier="1h", start=0):
+    return HistoryRollup.query.filter_by(kind="app", entity_id=1, tier=tier, start=start).one()
+
+
+def test_upsert_adds_deltas_and_merges_min_max(app):
+    db.session.execute(UPSERT_ROLLUP, [_delta(samples=2, up=1, users_min=5, users_max=9, users_sum=14)])
+    db.session.execute(UPSERT_ROLLUP, [_delta(samples=1, up=1, users_min=3, users_max=4, users_sum=3)])
+    db.session.execute(UPSERT_ROLLUP, [_delta(samples=1)])     # endpoint-like: no users
+    db.session.commit()
+
+    row = _stored()
+    assert (row.samples, row.up, row.users_sum) == (4, 2, 17)
+    assert (row.users_min, row.users_max) == (3, 9)
+
+
+def test_flushes_send_deltas_that_add_up(wb):
+    now = int(time.time())
+
+    rollups.record("app", 1, now, {"healthy": 1, "active_users": 10})
+    assert rollups.flush() == len(rollups.TIERS)
+    assert wb.flush(5)
+
+    rollups.record("app", 1, now, {"healthy": 0, "active_users": 30})
+    rollups.flush()
+    assert wb.flush(5)
+
+    start = now - now % HOUR
+    row = _stored("1h", start)
+    assert (row.samples, row.up, row.users_sum) == (2, 1, 40)
+    assert (row.users_min, row.users_max) == (10, 30)
+
+
+def test_query_merges_stored_and_unflushed(wb):
+    now = int(time.time())
+    start = now - now % HOUR
+
+    rollups.record("app", 1, now, {"healthy": 1, "active_users": 10})
+    rollups.flush()
+    assert wb.flush(5)
+    rollups.record("app", 1, now, {"healthy": 1, "active_users": 20})
+
+    [row] = rollups.query("app", 1, "1h", start, now)
+    assert (row["samples"], row["users_sum"], row["users_max"]) == (2, 30, 20)
+
+
+def test_compact_prunes_each_tier_to_its_retention(wb):
+    now = int(time.time())
+    rows = []
+    for tier, (span, retention) in rollups.TIERS.items():
+        old = now - retention - span
+        rows += [_delta(tier=tier, start=old - old % span, samples=1),
+                 _delta(tier=tier, start=now - now % span, samples=1)]
+    db.session.execute(UPSERT_ROLLUP, rows)
+
+    old_block = now - rollups.RAW_RETENTION - DAY
+    for start in (old_block - old_block % HOUR, now - now % HOUR):
+        db.session.add(HistoryBlock(
+            kind="app", entity_id=1, start=start,
+            fields="healthy:int", count=0, data=b""
+        ))
+    db.session.commit()
+
+    rollups.compact()
+    assert wb.flush(5)
+
+    for tier, (span, _) in rollups.TIERS.items():
+        starts = [r.start for r in HistoryRollup.query.filter_by(tier=tier)]
+        assert starts == [now - now % span]
+    assert [b.start for b in HistoryBlock.query] == [now - now % HOUR]
@@ -0,0 +1,163 @@
+import pytest
+
+import scheduler
+import topology
+from models import db, Application
+from scheduler import (
+    AppTarget, EndpointTarget, claim_group, push, reload_targets, share_groups
+)
+
+
+def _app(app_id, health, users=None):
+    return AppTarget(
+        app_id, f"A{app_id}", "PROD",
+        health, users or f"http://app{app_id}.test/users",
+        None, None
+    )
+
+
+def _endpoint(ep_id, connectivity, total=None):
+    return EndpointTarget(
+        ep_id, 1, "INBOUND", "A1", "PROD", "SAP",
+        connectivity, total or f"http://ep{ep_id}.test/total",
+        f"http://ep{ep_id}.test/failed",
+        None, None
+    )
+
+
+@pytest.fixture(autouse=True)
+def clean_scheduler():
+    yield
+    scheduler.SPECS.clear()
+    scheduler.TARGETS.clear()
+    scheduler._SHARED.clear()
+    scheduler._SCHEDULED.clear()
+    scheduler._HEAP.clear()
+    scheduler._LOADED = None
+
+
+def test_targets_sharing_a_url_are_grouped():
+    specs = {
+        ("app", 1): _app(1, "http://gw.test/health"),
+        ("app", 2): _app(2, "http://GW.test:80/health"),
+        ("app", 3): _app(3, "http://other.test/health"),
+    }
+    groups = share_groups(specs)
+
+    assert set(groups) == {("app", 1), ("app", 2)}
+    assert set(groups[("app", 1)]) == {("app", 1), ("app", 2)}
+    assert groups[("app", 1)] == groups[("app", 2)]
+
+
+def test_groups_are_transitive_across_kinds():
+    specs = {
+        ("app", 1): _app(1, "http://gw.test/health"),
+        ("endpoint", 7): _endpoint(7, "http://gw.test/health",
+                                   total="http://gw.test/count"),
+        ("app", 2): _app(2, "http://solo.test/", users="http://gw.test/count"),
+        # Same URL, but a counter read is not a health check
+        ("app", 3): _app(3, "http://solo.test/x", users="http://gw.test/health"),
+    }
+    groups = share_groups(specs)
+
+    assert set(groups[("app", 1)]) == {("app", 1), ("endpoint", 7), ("app", 2)}
+    assert ("app", 3) not in groups
+
+
+def test_due_target_claims_its_waiting_group():
+    specs = {
+        ("app", 1): _app(1, "http://gw.test/health"),
+        ("app", 2): _app(2, "http://gw.test/health"),
+        ("app", 3): _app(3, "http://gw.test/health"),
+    }
+    scheduler.SPECS.update(specs)
+    scheduler._SHARED.update(share_groups(specs))
+
+    push(("app", 1), 100)
+    push(("app", 2), 200)
+    scheduler._SCHEDULED[("app", 3)] = scheduler.IN_FLIGHT
+
+    claimed = claim_group(("app", 1))
+
+    # app 3 is still in flight: it completes and queues on its own
+    assert claimed == [("app", 1), ("app", 2)]
+    assert all(
+        scheduler._SCHEDULED[t] == scheduler.IN_FLIGHT for t in specs
+    )
+
+
+def test_failing_housekeeping_is_requeued(monkeypatch, capsys):
+    monkeypatch.setattr(scheduler.db.session, "remove", lambda: None)
+
+    def broken():
+        raise RuntimeError("database is locked")
+
+    scheduler.run_housekeeping(scheduler.RELOAD, broken, 5)
+
+    assert "database is locked" in capsys.readouterr().out
+    assert scheduler._SCHEDULED[scheduler.RELOAD] == scheduler._HEAP[0][1]
+
+
+def _live():
+    """Targets with a current heap entry -> its sequence number"""
+    return {
+        target: seq for _, seq, target in scheduler._HEAP
+        if scheduler._SCHEDULED.get(target) == seq
+    }
+
+
+def _targets(application):
+    return {("app", application.id)} | {
+        ("endpoint", ep.id)
+        for interface in application.interfaces
+        for ep in interface.endpoints
+    }
+
+
+def test_first_reload_queues_every_active_target(add_app):
+    a = add_app("a", endpoints=2)
+    b = add_app("b")
+
+    reload_targets()
+
+    assert set(scheduler.SPECS) == _targets(a) | _targets(b)
+    assert set(_live()) == set(scheduler.SPECS)
+
+
+def test_reload_adds_changes_and_removes_incrementally(add_app):
+    a = add_app("a", endpoints=2)
+    b = add_app("b")
+    c = add_app("c")
+    reload_targets()
+    before = _live()
+
+    # The reload ended the session: fetch the rows again
+    a, b, c = (db.session.get(Application, x.id) for x in (a, b, c))
+
+    d = add_app("d")                                   # added
+
+    moved = min(a.interfaces[0].endpoints, key=lambda e: e.id)
+    moved.connectivity_url = "http://a.test/moved"     # new URL
+    topology.record_change("endpoint", moved)
+
+    b.name = "renamed"                                 # label only
+    topology.record_change("app", b)
+
+    topology.record_change("app", c)                   # removed
+    db.session.delete(c)
+    db.session.commit()
+
+    reload_targets()
+    after = _live()
+
+    assert _targets(d) <= set(scheduler.SPECS) and _targets(d) <= set(after)
+
+    assert after[("endpoint", moved.id)] != before[("endpoint", moved.id)]
+    assert scheduler.SPECS[("endpoint", moved.id)].connectivity_url == "http://a.test/moved"
+    for target in _targets(a) - {("endpoint", moved.id)}:
+        assert after[target] == before[target]
+
+    assert scheduler.SPECS[("app", b.id)].name == "renamed"
+    assert after[("app", b.id)] == before[("app", b.id)]
+
+    assert not _targets(c) & set(scheduler.SPECS)
@@ -0,0 +1,24 @@
+from series import lttb
+
+
+def test_short_series_is_returned_unchanged():
+    points = [(i, i * 2) for i in range(10)]
+    assert lttb(points, 20) == points
+    assert lttb(points, 2) == points
+
+
+def test_downsamples_to_the_threshold_keeping_the_ends():
+    points = [(i, (i * 37) % 11) for i in range(1000)]
+    sampled = lttb(points, 50)
+
+    assert len(sampled) == 50
+    assert sampled[0] == points[0]
+    assert sampled[-1] == points[-1]
+    assert [x for x, _ in sampled] == sorted(x for x, _ in sampled)
+
+
+def test_keeps_a_single_spike():
+    points = [(i, 0.0) for i in range(500)]
+    points[237] = (237, 100.0)
+
+    assert (237, 100.0) in lttb(points, 20)
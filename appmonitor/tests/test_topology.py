@@ -0,0 +1,69 @@
+import topology
+from models import db, InterfaceEndpoint
+
+
+def test_sync_without_changes_keeps_the_snapshot(add_app):
+    add_app("a")
+    snapshot = topology.refresh()
+
+    assert topology.sync() is snapshot
+
+
+def test_sync_reloads_only_the_changed_application(add_app):
+    a = add_app("a")
+    add_app("b")
+    before = topology.refresh()
+
+    a.name = "renamed"
+    topology.record_change("app", a)
+    db.session.commit()
+
+    after = topology.sync()
+
+    assert after.version > before.version
+    assert after.apps[a.id].name == "renamed"
+    b_id = next(k for k in before.apps if k != a.id)
+    assert after.apps[b_id] is before.apps[b_id]
+
+
+def test_sync_follows_endpoint_changes_and_deletes(add_app):
+    a = add_app("a", endpoints=2)
+    b = add_app("b")
+    topology.refresh()
+
+    ep = InterfaceEndpoint.query.filter_by(interface_id=a.interfaces[0].id).first()
+    ep.connectivity_url = "http://a.test/moved"
+    topology.record_change("endpoint", ep)
+    topology.record_change("app", b)
+    db.session.delete(b)
+    db.session.commit()
+
+    snapshot = topology.sync()
+
+    assert snapshot.endpoints[ep.id].connectivity_url == "http://a.test/moved"
+    assert list(snapshot.apps) == [a.id]
+
+
+def test_changes_since_a_version(add_app):
+    a = add_app("a")
+    start = topology.refresh().version
+
+    topology.record_change("app", a)
+    db.session.commit()
+    version = topology.sync().version
+
+    assert [(c.kind, c.app_id) for c in topology.changes_since(start)] == [("app", a.id)]
+    assert topology.changes_since(version) == []
+
+
+def test_changes_since_beyond_the_log_is_unknown(add_app, monkeypatch):
+    monkeypatch.setattr(topology, "CHANGE_LOG_SIZE", 2)
+    a = add_app("a")
+    start = topology.refresh().version
+
+    for _ in range(3):
+        topology.record_change("app", a)
+        db.session.commit()
+        topology.sync()
+
+    assert topology.changes_since(start) is None
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+import writer
+from models import AuditLog
+from writer import WriteBehind
+
+INSERT = AuditLog.__table__.insert()
+
+
+def _row(i):
+    return {
+        "user": "admin", "action": f"action {i}", "entity": "test",
+        "old_value": None, "new_value": None, "notes": None,
+        "timestamp": datetime(2026, 1, 1)
+    }
+
+
+def _actions():
+    return sorted(a.action for a in AuditLog.query.all())
+
+
+@pytest.fixture
+def wb(app, monkeypatch):
+    monkeypatch.setattr(writer, "RETRIES", 1)
+    w = WriteBehind(batch_size=10, flush_ms=50)
+    w.start(app)
+    yield w
+    w.stop()
+
+
+def test_rows_are_written_in_batches(wb, monkeypatch):
+    batches = []
+    write = wb._write
+    monkeypatch.setattr(wb, "_write", lambda rows: (batches.append(len(rows)), write(rows)))
+
+    assert wb.put_many(INSERT, [_row(i) for i in range(25)]) == 25
+    assert wb.flush(5)
+
+    assert len(_actions()) == 25
+    assert max(batches) <= 10
+    assert len(batches) < 25
+
+
+def test_flush_waits_for_rows_queued_before_it(wb):
+    for i in range(3):
+        wb.put(INSERT, _row(i))
+
+    assert wb.flush(5)
+    assert _actions() == ["action 0", "action 1", "action 2"]
+
+
+def test_failing_statement_does_not_take_the_batch_down(wb):
+    broken = AuditLog.__table__.insert().values(no_such_column=1)
+    wb.put(INSERT, _row(1))
+    wb.put(broken, {"user": "x"})
+    wb.put(INSERT, _row(2))
+
+    assert wb.flush(5)
+    assert _actions() == ["action 1", "action 2"]
+
+
+def test_failed_rows_go_to_the_fallback(wb):
+    broken = AuditLog.__table__.insert().values(no_such_column=1)
+    given_up = []
+    wb.on_drop(broken, given_up.extend)
+
+    wb.put(broken, {"user": "x"})
+    wb.put(INSERT, _row(1))
+
+    assert wb.flush(5)
+    assert given_up == [{"user": "x"}]
+    assert _actions() == ["action 1"]
+
+
+def test_stopped_writer_refuses_flush(app):
+    w = WriteBehind()
+    assert not w.running
+    assert w.flush(1) is False
@@ -0,0 +1,249 @@
+"""
+topology.py
+Applications, interfaces and endpoints as plain immutable tuples
+Loaded with one eager-joined query into a versioned in-memory
+snapshot; pages, APIs and the scheduler read it without touching
+the database. Admin writes append to the config change feed and
+the snapshot catches up by reloading only the applications named
+there.
+"""
+
+import threading
+
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from models import db, Application, ConfigChange, Interface
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+CHANGE_LOG_SIZE = 1000   # applied changes kept for changes_since()
+
+# =====================================================
+# NODES
+# Same attribute names as the models, so templates and the
+# scheduler's refresh helpers accept either.
+# =====================================================
+
+AppNode = namedtuple("AppNode", [
+    "id", "name", "environment",
+    "app_health_url", "active_users_url",
+    "min_poll_interval", "max_poll_interval",
+    "is_active",
+    "interfaces"          # tuple of InterfaceNode
+])
+
+InterfaceNode = namedtuple("InterfaceNode", [
+    "id", "source_app_id", "target_system_name", "direction",
+    "is_active",
+    "endpoints"           # tuple of EndpointNode
+])
+
+EndpointNode = namedtuple("EndpointNode", [
+    "id", "interface_id", "direction",
+    "connectivity_url", "transaction_count_url", "error_count_url",
+    "min_poll_interval", "max_poll_interval",
+    "is_active"
+])
+
+
+class Topology:
+    """Read-only indexes over a set of AppNodes"""
+
+    def __init__(self, apps, version=0):
+        self.version = version
+        self.apps = MappingProxyType({a.id: a for a in apps})
+        self.interfaces = MappingProxyType({
+            i.id: i for a in apps for i in a.interfaces
+        })
+        self.endpoints = MappingProxyType({
+            ep.id: ep
+            for i in self.interfaces.values()
+            for ep in i.endpoints
+        })
+
+    def active_apps(self):
+        return [a for a in self.apps.values() if a.is_active]
+
+    def active_interfaces(self, app_id=None):
+        """Active interfaces of one application, or of all of them"""
+        if app_id is None:
+            return [i for i in self.interfaces.values() if i.is_active]
+
+        app = self.apps.get(app_id)
+        return [i for i in app.interfaces if i.is_active] if app else []
+
+    def application_of(self, interface):
+        return self.apps[interface.source_app_id]
+
+
+# =====================================================
+# LOADER
+# =====================================================
+
+def _endpoint_node(ep):
+    return EndpointNode(
+        ep.id, ep.interface_id, ep.direction,
+        ep.connectivity_url, ep.transaction_count_url, ep.error_count_url,
+        ep.min_poll_interval, ep.max_poll_interval,
+        bool(ep.is_active)
+    )
+
+
+def _interface_node(interface):
+    return InterfaceNode(
+        interface.id, interface.source_app_id,
+        interface.target_system_name, interface.direction,
+        bool(interface.is_active),
+        tuple(
+            _endpoint_node(ep)
+            for ep in sorted(interface.endpoints, key=lambda e: e.id)
+        )
+    )
+
+
+def _app_node(app):
+    return AppNode(
+        app.id, app.name, app.environment,
+        app.app_health_url, app.active_users_url,
+        app.min_poll_interval, app.max_poll_interval,
+        bool(app.is_active),
+        tuple(
+            _interface_node(i)
+            for i in sorted(app.interfaces, key=lambda i: i.id)
+        )
+    )
+
+
+def load(version=0, app_ids=None):
+    """
+    Every application (or those in app_ids) with all its interfaces
+    and endpoints, in a single joined query. Active and inactive rows
+    are included; callers filter.
+    """
+    query = Application.query.options(
+        joinedload(Application.interfaces)
+        .joinedload(Interface.endpoints)
+    )
+
+    if app_ids is not None:
+        query = query.filter(Application.id.in_(app_ids))
+
+    apps = query.order_by(Application.id).all()
+    return Topology([_app_node(a) for a in apps], version)
+
+
+# =====================================================
+# CHANGE FEED
+# =====================================================
+
+Change = namedtuple("Change", ["version", "kind", "entity_id", "app_id"])
+
+
+def record_change(kind, entity):
+    """
+    Adds the feed entry for a changed Application / Interface /
+    InterfaceEndpoint to the session; commit it with the change.
+    """
+    if kind == "app":
+        app_id = entity.id
+    elif kind == "interface":
+        app_id = entity.source_app_id
+    else:
+        app_id = db.session.get(Interface, entity.interface_id).source_app_id
+
+    db.session.add(ConfigChange(kind=kind, entity_id=entity.id, app_id=app_id))
+
+
+# =====================================================
+# SNAPSHOT
+# =====================================================
+
+_SNAPSHOT = None
+_REFRESH_LOCK = threading.Lock()
+
+# Changes applied since the last full load, oldest first
+_CHANGES = deque()
+_LOG_FLOOR = 0     # changes_since() answers for versions >= this
+
+
+def current():
+    """
+    The latest snapshot; loaded on first use (needs an app context).
+    Callers keep the object they got for a consistent view.
+    """
+    return _SNAPSHOT or refresh()
+
+
+def refresh():
+    """Reloads the whole topology and swaps it in atomically"""
+    global _SNAPSHOT, _LOG_FLOOR
+
+    with _REFRESH_LOCK:
+        # Read the version first: changes racing the load get re-applied
+        version = db.session.query(func.max(ConfigChange.id)).scalar() or 0
+        _SNAPSHOT = load(version=version)
+        _CHANGES.clear()
+        _LOG_FLOOR = version
+        return _SNAPSHOT
+
+
+def sync():
+    """
+    Applies config changes newer than the snapshot, reloading only
+    the applications they name. One indexed query when nothing changed.
+    """
+    global _SNAPSHOT, _LOG_FLOOR
+
+    if _SNAPSHOT is None:
+        return refresh()
+
+    with _REFRESH_LOCK:
+        snapshot = _SNAPSHOT
+        rows = (
+            ConfigChange.query
+            .filter(ConfigChange.id > snapshot.version)
+            .order_by(ConfigChange.id)
+            .all()
+        )
+        if not rows:
+            return snapshot
+
+        app_ids = {r.app_id for r in rows}
+        fresh = load(app_ids=app_ids).apps
+
+        apps = dict(snapshot.apps)
+        for app_id in app_ids:
+            if app_id in fresh:
+                apps[app_id] = fresh[app_id]
+            else:
+                apps.pop(app_id, None)
+
+        _SNAPSHOT = Topology(
+            [apps[k] for k in sorted(apps)],
+            rows[-1].id
+        )
+
+        _CHANGES.extend(
+            Change(r.id, r.kind, r.entity_id, r.app_id) for r in rows
+        )
+        while len(_CHANGES) > CHANGE_LOG_SIZE:
+            _LOG_FLOOR = _CHANGES.popleft().version
+
+        return _SNAPSHOT
+
+
+def changes_since(version):
+    """
+    Changes applied after a snapshot version, or None when they are
+    no longer all known (caller falls back to a full rebuild).
+    """
+    with _REFRESH_LOCK:
+        if version < _LOG_FLOOR:
+            return None
+        return [c for c in _CHANGES if c.version > version]
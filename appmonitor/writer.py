@@ -0,0 +1,224 @@
+"""
+writer.py
+Write-behind persistence
+Producers queue rows and return; one writer thread inserts them
+in batches (executemany, one transaction per statement per batch),
+so SQLite is never on the probe / scheduler hot path.
+"""
+
+import atexit
+import queue
+import threading
+import time
+
+from metrics import Counter, Gauge, Histogram
+from models import db
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+BATCH_SIZE = 500       # rows per transaction at most
+FLUSH_MS = 200         # a partial batch is written after this long
+MAX_QUEUE = 20000      # queued rows before producers are held back
+PUT_TIMEOUT = 1.0      # seconds a producer waits on a full queue
+RETRIES = 3            # attempts per batch (SQLite "database is locked")
+STOP_TIMEOUT = 30      # seconds allowed for the final flush at exit
+
+_STOP = object()
+
+
+class _Barrier:
+    """Queued by flush(); set once every row before it is written"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+# =====================================================
+# WRITER
+# =====================================================
+
+class WriteBehind:
+    def __init__(self, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS,
+                 max_queue=MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = False
+        self._fallbacks = {}     # stmt -> fn(rows) for rows given up on
+
+    @property
+    def running(self):
+        """True while the writer accepts rows (started, not stopping)"""
+        return (
+            self._thread is not None and self._thread.is_alive()
+            and not self._stopping
+        )
+
+    def start(self, app):
+        """Starts the writer thread; rows are flushed at interpreter exit"""
+        if self.running:
+            return
+
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(app.app_context,),
+            name="db-writer",
+            daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def on_drop(self, stmt, fn):
+        """
+        fn(rows) is called on the writer thread (app context, fresh
+        session) with stmt's rows whenever their batch fails RETRIES
+        times, instead of dropping them
+        """
+        self._fallbacks[stmt] = fn
+
+    def put(self, stmt, row, timeout=PUT_TIMEOUT):
+        """
+        Queues one row for stmt (a Core insert). Blocks up to timeout
+        while the queue is full; returns False if the row was refused.
+        """
+        try:
+            self.queue.put((stmt, row), timeout=timeout)
+            return True
+        except queue.Full:
+            REFUSED.inc()
+            return False
+
+    def put_many(self, stmt, rows, timeout=PUT_TIMEOUT):
+        """Returns how many of rows were queued (a prefix of them)"""
+        deadline = time.monotonic() + timeout
+
+        for i, row in enumerate(rows):
+            if not self.put(stmt, row, max(0, deadline - time.monotonic())):
+                return i
+
+        return len(rows)
+
+    def flush(self, timeout=STOP_TIMEOUT):
+        """Blocks until everything queued so far is written"""
+        if not self.running:
+            return False
+
+        barrier = _Barrier()
+        self.queue.put(barrier)
+        return barrier.done.wait(timeout)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        if not self.running:
+            return
+
+        # Rows put after _STOP would never be written
+        self._stopping = True
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ----- writer thread -----
+
+    def _collect(self):
+        """Up to batch_size rows, waiting at most flush_ms after the first"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_ms / 1000
+
+        while len(batch) < self.batch_size and isinstance(batch[-1], tuple):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _write(self, rows):
+        by_stmt = {}
+        for stmt, row in rows:
+            by_stmt.setdefault(stmt, []).append(row)
+
+        # Own transaction per statement: one failing table does not
+        # take the other rows of the batch down with it
+        for stmt, params in by_stmt.items():
+            self._write_group(stmt, params)
+
+    def _write_group(self, stmt, params):
+        started = time.time()
+
+        for attempt in range(1, RETRIES + 1):
+            try:
+                db.session.execute(stmt, params)
+                db.session.commit()
+                break
+            except Exception as e:
+                db.session.rollback()
+                if attempt < RETRIES:
+                    time.sleep(0.1 * attempt)
+                    continue
+
+                fallback = self._fallbacks.get(stmt)
+                if fallback is None:
+                    DROPPED.inc(len(params))
+                    print(f"[Writer] Dropped {len(params)} rows: {e}")
+                else:
+                    print(f"[Writer] Batch of {len(params)} rows failed ({e}), "
+                          f"handing them to the fallback")
+                    fallback(params)
+                return
+            finally:
+                db.session.remove()
+
+        BATCH_DURATION.observe(time.time() - started)
+        WRITTEN.inc(len(params))
+
+    def _run(self, app_context):
+        with app_context():
+            while True:
+                batch = self._collect()
+
+                # Markers only ever end a batch
+                marker = None if isinstance(batch[-1], tuple) else batch.pop()
+
+                if batch:
+                    self._write(batch)
+
+                if marker is _STOP:
+                    return
+                if marker is not None:
+                    marker.done.set()
+
+
+WRITER = WriteBehind()
+
+
+# =====================================================
+# INSTRUMENTATION
+# =====================================================
+
+WRITTEN = Counter(
+    "writer_rows_written_total",
+    "Rows inserted by the write-behind writer"
+)
+REFUSED = Counter(
+    "writer_rows_refused_total",
+    "Rows refused because the write queue stayed full"
+)
+DROPPED = Counter(
+    "writer_rows_dropped_total",
+    "Rows lost after a batch failed RETRIES times"
+)
+BATCH_DURATION = Histogram(
+    "writer_batch_duration_seconds",
+    "Time to insert and commit one batch"
+)
+Gauge(
+    "writer_queue_depth",
+    "Rows waiting for the writer",
+    func=lambda: WRITER.queue.qsize()
+)